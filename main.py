@@ -21,7 +21,7 @@ if src_path.exists():
     sys.path.insert(0, str(src_path))
 
 from utils import setup_project_paths
-from main_monitor import VPSMonitor
+from main_monitor import VPSMonitor, install_event_loop_policy
 
 
 class BotInstanceManager:
@@ -87,9 +87,10 @@ class BotInstanceManager:
         # 注册清理函数
         atexit.register(self.cleanup)
         
-        # 设置信号处理
-        signal.signal(signal.SIGINT, self._signal_handler)
-        signal.signal(signal.SIGTERM, self._signal_handler)
+        # 设置信号处理：在事件循环中处理，通知监控器走正常的退出流程
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self._signal_handler, signum)
         
         try:
             await self.monitor.start()
@@ -99,11 +100,14 @@ class BotInstanceManager:
         finally:
             await self.cleanup_async()
     
-    def _signal_handler(self, signum, frame):
-        """信号处理器"""
+    def _signal_handler(self, signum):
+        """信号处理器：请求监控器停止，再次收到信号时按默认方式立即中断"""
         print(f"\n收到信号 {signum}，正在优雅关闭...")
-        asyncio.create_task(self.cleanup_async())
-        sys.exit(0)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        if self.monitor:
+            self.monitor.request_stop()
     
     async def cleanup_async(self):
         """异步清理资源"""
@@ -188,7 +192,10 @@ if __name__ == "__main__":
         ]
     )
     
-    # 运行主程序
+    # 运行主程序（可用时使用 uvloop 事件循环）
+    if install_event_loop_policy():
+        logging.info("已启用 uvloop 事件循环")
+    
     try:
         asyncio.run(main())
     except Exception as e:
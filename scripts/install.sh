@@ -551,9 +551,13 @@ try:
     
     async def init():
         db = DatabaseManager("vps_monitor.db")
-        await db.initialize()
-        print("✅ 多用户数据库初始化成功")
-        return True
+        try:
+            await db.initialize()
+            print("✅ 多用户数据库初始化成功")
+            return True
+        finally:
+            # 关闭数据库长连接，否则脚本无法退出
+            await db.close()
 
     if __name__ == "__main__":
         result = asyncio.run(init())
@@ -931,9 +935,9 @@ sys.path.insert(0, str(Path.cwd() / 'src'))
 from database_manager import DatabaseManager
 
 async def migrate():
+    # 初始化新的多用户数据库
+    db = DatabaseManager('vps_monitor.db')
     try:
-        # 初始化新的多用户数据库
-        db = DatabaseManager('vps_monitor.db')
         await db.initialize()
         
         migrated_count = 0
@@ -1016,6 +1020,9 @@ async def migrate():
     except Exception as e:
         print(f'❌ 迁移失败: {e}')
         return False
+    finally:
+        # 关闭数据库长连接，否则脚本无法退出
+        await db.close()
 
 import os
 result = asyncio.run(migrate())
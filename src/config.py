@@ -7,8 +7,8 @@ VPS监控系统 v3.1
 import json
 import logging
 from pathlib import Path
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, fields
+from typing import Optional, Tuple
 
 
 @dataclass
@@ -22,11 +22,13 @@ class Config:
     notification_cooldown: int = 600
     request_timeout: int = 30
     retry_delay: int = 60
+    max_concurrent_checks: int = 10
+    per_host_concurrency: int = 4
     user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
     proxy: Optional[str] = None
     debug: bool = False
     log_level: str = "INFO"
-    admin_ids: List[str] = None
+    admin_ids: Tuple[str, ...] = ()
     items_per_page: int = 10
     # 新增配置项
     enable_selenium: bool = True
@@ -52,8 +54,12 @@ class Config:
         if not self.chat_id or self.chat_id == "YOUR_TELEGRAM_CHAT_ID":
             raise ValueError("请配置正确的Telegram Chat ID")
         
-        if self.admin_ids is None:
-            self.admin_ids = []
+        # 加载时统一转换为去重的字符串元组，JSON 中写成数字的ID也能与 str(user_id) 匹配
+        self.admin_ids = tuple(dict.fromkeys(str(admin_id) for admin_id in (self.admin_ids or ())))
+
+
+# Config 的全部字段名，加载时用于过滤配置文件中的未知字段
+_CONFIG_FIELDS = frozenset(f.name for f in fields(Config))
 
 
 class ConfigManager:
@@ -80,10 +86,9 @@ class ConfigManager:
                 if missing_fields:
                     raise ValueError(f"配置文件缺少必需字段: {missing_fields}")
                 
-                valid_fields = {field.name for field in Config.__dataclass_fields__.values()}
-                filtered_data = {k: v for k, v in data.items() if k in valid_fields}
+                filtered_data = {k: v for k, v in data.items() if k in _CONFIG_FIELDS}
                 
-                extra_fields = set(data.keys()) - valid_fields
+                extra_fields = data.keys() - _CONFIG_FIELDS
                 if extra_fields:
                     self.logger.warning(f"配置文件中包含未知字段，已忽略: {extra_fields}")
                 
@@ -4,13 +4,18 @@
 修复版 - 解决通知功能相关问题
 """
 
+import os
+import shutil
 import sqlite3
 import asyncio
 import aiosqlite
 import json
 import logging
+import secrets
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Any
+from typing import AsyncIterator, Dict, Iterable, List, Tuple, Optional, Any
 from dataclasses import dataclass, asdict
 from pathlib import Path
 
@@ -95,23 +100,296 @@ class ItemNotificationHistory:
     status: bool  # True=有货，False=缺货
     
 
+@dataclass
+class SweepContext:
+    """一次通知轮询共用的时间上下文，避免同一轮内多次获取当前时间"""
+    now: datetime
+    today: str
+    now_iso: str
+    hour: int
+    
+    @classmethod
+    def create(cls, now: Optional[datetime] = None) -> 'SweepContext':
+        """根据给定时间（默认当前时间）创建上下文"""
+        now = now or datetime.now()
+        return cls(now=now, today=now.date().isoformat(), now_iso=now.isoformat(), hour=now.hour)
+
+
+def _new_id() -> str:
+    """生成记录ID（随机16位十六进制，避免同一毫秒内生成的ID冲突）"""
+    return secrets.token_hex(8)
+
+
+def _new_id_and_time() -> Tuple[str, str]:
+    """返回 (新记录ID, 当前ISO时间字符串)"""
+    return _new_id(), datetime.now().isoformat()
+
+
+# 通知设置更新语句，参数依次为各字段新值（NULL 表示不修改）、updated_at、user_id
+SQL_UPDATE_NOTIFICATION_SETTINGS = """
+    UPDATE user_notification_settings 
+    SET enable_notifications = COALESCE(?, enable_notifications),
+        notification_cooldown = COALESCE(?, notification_cooldown),
+        max_daily_notifications = COALESCE(?, max_daily_notifications),
+        quiet_hours_start = COALESCE(?, quiet_hours_start),
+        quiet_hours_end = COALESCE(?, quiet_hours_end),
+        updated_at = ?
+    WHERE user_id = ?
+"""
+
+# DELETE ... RETURNING 需要 SQLite 3.35+
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# monitor_items 的显式列清单，顺序与 MonitorItem 字段一致
+MONITOR_ITEM_COLUMNS = (
+    "id, user_id, name, url, config, created_at, last_checked, status, "
+    "notification_count, success_count, failure_count, last_error, tags, enabled, is_global"
+)
+
+
+def _row_to_user(row: aiosqlite.Row) -> User:
+    """将 users 记录（SELECT *）转换为 User"""
+    return User(
+        id=row[0],
+        username=row[1],
+        first_name=row[2],
+        last_name=row[3],
+        is_admin=bool(row[4]),
+        is_banned=bool(row[5]),
+        created_at=row[6],
+        last_active=row[7],
+        total_monitors=row[8],
+        total_notifications=row[9],
+        daily_add_count=row[10],
+        last_add_date=row[11],
+        enable_notifications=bool(row[12]) if len(row) > 12 else True
+    )
+
+
+def _row_to_monitor_item(row: aiosqlite.Row) -> MonitorItem:
+    """按列名将 monitor_items 记录转换为 MonitorItem"""
+    status = row["status"]
+    return MonitorItem(
+        id=row["id"],
+        user_id=row["user_id"],
+        name=row["name"],
+        url=row["url"],
+        config=row["config"],
+        created_at=row["created_at"],
+        last_checked=row["last_checked"],
+        status=None if status is None else bool(status),
+        notification_count=row["notification_count"],
+        success_count=row["success_count"],
+        failure_count=row["failure_count"],
+        last_error=row["last_error"],
+        tags=row["tags"],
+        enabled=bool(row["enabled"]),
+        is_global=bool(row["is_global"])
+    )
+
+
 class DatabaseManager:
     """多用户数据库管理器"""
     
+    # 每个连接都需要设置的 PRAGMA（journal_mode=WAL 是持久化的，只需在初始化时设置一次）
+    CONNECTION_PRAGMAS = """
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA cache_size=-20000;
+        PRAGMA wal_autocheckpoint=10000;
+    """
+    
+    # PRAGMA optimize 执行间隔（秒）
+    OPTIMIZE_INTERVAL = 15 * 60
+    
+    # WAL 截断检查点执行间隔（秒）；自动检查点阈值调高后由它控制 WAL 文件大小
+    CHECKPOINT_INTERVAL = 5 * 60
+    
+    # 长连接的语句缓存大小（sqlite3 默认 100）
+    CACHED_STATEMENTS = 256
+    
+    # 热点语句：固定为常量，保证每次执行的 SQL 文本一致，命中连接的语句缓存
+    _SQL_INSERT_HISTORY = """
+        INSERT INTO check_history 
+        (monitor_id, check_time, status, response_time, error_message, 
+         http_status, content_length, confidence, method_used)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _SQL_SELECT_NOTIFICATION_SETTINGS = "SELECT * FROM user_notification_settings WHERE user_id = ?"
+    _SQL_SELECT_LAST_ITEM_NOTIFICATION = """
+        SELECT notification_time 
+        FROM item_notification_history 
+        WHERE user_id = ? AND item_id = ?
+        ORDER BY notification_time DESC
+        LIMIT 1
+    """
+    
+    # 监控项缓存的最长有效期（秒）
+    ITEMS_CACHE_TTL = 300
+    
+    # 检查历史缓冲：按时间间隔（秒）或条数阈值批量写入
+    HISTORY_FLUSH_INTERVAL = 2.0
+    HISTORY_FLUSH_THRESHOLD = 500
+    # 旧数据清理：(表名, 时间列)，按批删除以缩短单个写事务
+    CLEANUP_TARGETS = (
+        ('check_history', 'check_time'),
+        ('user_actions', 'timestamp'),
+        ('notification_history', 'sent_at'),
+        ('item_notification_history', 'notification_time'),
+    )
+    CLEANUP_BATCH_SIZE = 5000
+    
+    # IN (...) 查询每批的参数个数（旧版 SQLite 单条语句最多 999 个参数）
+    IN_QUERY_BATCH_SIZE = 500
+    # 清理后每批归还给文件系统的空闲页数（auto_vacuum=INCREMENTAL）
+    VACUUM_BATCH_PAGES = 2000
+    # PRAGMA auto_vacuum 的取值：0=NONE, 1=FULL, 2=INCREMENTAL
+    AUTO_VACUUM_INCREMENTAL = 2
+    
     def __init__(self, db_path: str = "vps_monitor.db"):
         self.db_path = Path(db_path)
         self.logger = logging.getLogger(__name__)
+        self._db: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+        self._optimize_task: Optional[asyncio.Task] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
+        self._history_buffer: List[tuple] = []
+        self._status_buffer: Dict[str, Tuple[bool, str]] = {}
+        self._items_cache: Optional[Dict[str, MonitorItem]] = None
+        self._items_cache_time = 0.0
+        self._history_flush_event = asyncio.Event()
+        self._history_flush_task: Optional[asyncio.Task] = None
+    
+    @asynccontextmanager
+    async def _connect(self) -> AsyncIterator[aiosqlite.Connection]:
+        """获取数据库连接
+        
+        初始化后复用同一个长连接，并用锁保证同一时间只有一个操作在使用它；
+        操作结束时若仍有未提交的写入则回滚，与原先关闭临时连接时的行为一致。
+        未初始化时退回到临时连接。
+        """
+        if self._db is None:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                await db.executescript(self.CONNECTION_PRAGMAS)
+                yield db
+            return
         
+        async with self._lock:
+            try:
+                yield self._db
+            finally:
+                if self._db.in_transaction:
+                    await self._db.rollback()
+    
     async def initialize(self) -> None:
-        """初始化数据库"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """初始化数据库
+        
+        所有数据库操作都要经过 aiosqlite 工作线程与事件循环调度，
+        入口程序在 asyncio.run 之前可选安装 uvloop 以降低调度开销。
+        """
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.db_path, cached_statements=self.CACHED_STATEMENTS)
+            self._db.row_factory = aiosqlite.Row
+            await self._db.executescript(self.CONNECTION_PRAGMAS)
+        
+        async with self._connect() as db:
+            # 增量 VACUUM 只在新建数据库时设置；已有数据库需由管理员显式转换
+            # （见 enable_incremental_vacuum），避免运行中执行整库 VACUUM
+            async with db.execute("PRAGMA page_count") as cursor:
+                is_new_database = (await cursor.fetchone())[0] == 0
+            if is_new_database:
+                await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await db.execute("PRAGMA journal_mode=WAL")
             await self._create_tables(db)
             await self._create_indexes(db)
             await self._migrate_old_data(db)
             await db.commit()
         
+        if self._optimize_task is None:
+            self._optimize_task = asyncio.create_task(self._optimize_loop())
+        if self._checkpoint_task is None:
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+        if self._history_flush_task is None:
+            self._history_flush_task = asyncio.create_task(self._history_flush_loop())
+        
         self.logger.info("多用户数据库初始化完成")
     
+    async def _optimize_loop(self) -> None:
+        """定期执行 PRAGMA optimize，保持查询规划器统计信息更新"""
+        while True:
+            await asyncio.sleep(self.OPTIMIZE_INTERVAL)
+            try:
+                async with self._connect() as db:
+                    await db.execute("PRAGMA optimize")
+            except Exception as e:
+                self.logger.warning(f"PRAGMA optimize 执行失败: {e}")
+    
+    async def _checkpoint_loop(self) -> None:
+        """定期执行 TRUNCATE 检查点，把 WAL 写回主库并截断 WAL 文件"""
+        while True:
+            await asyncio.sleep(self.CHECKPOINT_INTERVAL)
+            try:
+                async with self._connect() as db:
+                    await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception as e:
+                self.logger.warning(f"WAL 检查点执行失败: {e}")
+    
+    async def _history_flush_loop(self) -> None:
+        """按间隔或缓冲区达到阈值时批量写入检查历史和监控项状态"""
+        while True:
+            try:
+                await asyncio.wait_for(self._history_flush_event.wait(), self.HISTORY_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._history_flush_event.clear()
+            await self.flush()
+    
+    async def flush(self) -> None:
+        """立即写入缓冲中的检查历史和监控项状态"""
+        if not self._history_buffer and not self._status_buffer:
+            return
+        
+        history_rows, self._history_buffer = self._history_buffer, []
+        status_buffer, self._status_buffer = self._status_buffer, {}
+        status_rows = [(item_id, status, checked_at) for item_id, (status, checked_at) in status_buffer.items()]
+        try:
+            # shield：close() 取消后台任务时，已取出缓冲区的这批数据仍会写完
+            await asyncio.shield(self._write_check_results(history_rows, status_rows))
+        except Exception as e:
+            self.logger.error(
+                f"批量写入检查结果失败 (历史 {len(history_rows)} 条, 状态 {len(status_rows)} 条): {e}"
+            )
+    
+    async def close(self) -> None:
+        """停止后台任务、写入剩余检查历史并关闭数据库连接"""
+        for task in (self._optimize_task, self._checkpoint_task, self._history_flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._optimize_task = None
+        self._checkpoint_task = None
+        self._history_flush_task = None
+        
+        await self.flush()
+        
+        if self._db is not None:
+            async with self._lock:
+                await self._db.close()
+                self._db = None
+    
+    async def __aenter__(self) -> "DatabaseManager":
+        """async with 入口：初始化数据库，退出时自动关闭"""
+        await self.initialize()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
     async def _create_tables(self, db: aiosqlite.Connection) -> None:
         """创建数据表"""
         
@@ -264,19 +542,30 @@ class DatabaseManager:
             "CREATE INDEX IF NOT EXISTS idx_monitor_items_url ON monitor_items(url)",
             "CREATE INDEX IF NOT EXISTS idx_monitor_items_enabled ON monitor_items(enabled)",
             "CREATE INDEX IF NOT EXISTS idx_monitor_items_global ON monitor_items(is_global)",
-            "CREATE INDEX IF NOT EXISTS idx_check_history_monitor_id ON check_history(monitor_id)",
-            "CREATE INDEX IF NOT EXISTS idx_check_history_check_time ON check_history(check_time)",
+            "CREATE INDEX IF NOT EXISTS idx_check_history_monitor_time ON check_history(monitor_id, check_time DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_check_history_success_time ON check_history(check_time, status) WHERE status = 1",
+            "CREATE INDEX IF NOT EXISTS idx_check_history_covering ON check_history(check_time, status, response_time, confidence)",
             "CREATE INDEX IF NOT EXISTS idx_notification_history_user_id ON notification_history(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_actions_user_id ON user_actions(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp ON user_actions(timestamp)",
             "CREATE INDEX IF NOT EXISTS idx_daily_statistics_date ON daily_statistics(date)",
             "CREATE INDEX IF NOT EXISTS idx_notification_settings_user_id ON user_notification_settings(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_notification_history_user_item ON item_notification_history(user_id, item_id)",
+            "CREATE INDEX IF NOT EXISTS idx_notification_history_user_item_time ON item_notification_history(user_id, item_id, notification_time DESC)",
             "CREATE INDEX IF NOT EXISTS idx_notification_history_time ON item_notification_history(notification_time)"
         ]
         
+        # 已被上面以相同列开头的复合索引覆盖的旧索引
+        superseded_indexes = [
+            "idx_check_history_monitor_id",
+            "idx_check_history_check_time",
+            "idx_notification_history_user_item"
+        ]
+        
         for index_sql in indexes:
             await db.execute(index_sql)
+        
+        for index_name in superseded_indexes:
+            await db.execute(f"DROP INDEX IF EXISTS {index_name}")
     
     async def _migrate_old_data(self, db: aiosqlite.Connection) -> None:
         """迁移旧版本数据"""
@@ -307,28 +596,21 @@ class DatabaseManager:
                 await db.execute("ALTER TABLE users ADD COLUMN enable_notifications INTEGER DEFAULT 1")
                 self.logger.info("添加了用户通知开关字段")
             
-            # 为现有用户创建通知设置
-            cursor = await db.execute("SELECT id FROM users")
-            users = await cursor.fetchall()
+            # 为还没有通知设置的用户创建默认设置
+            cursor = await db.execute("""
+                SELECT u.id FROM users u
+                LEFT JOIN user_notification_settings s ON s.user_id = u.id
+                WHERE s.user_id IS NULL
+            """)
+            missing_users = await cursor.fetchall()
             
-            created_count = 0
-            for user_row in users:
-                user_id = user_row[0]
-                # 检查是否已有设置
-                check_cursor = await db.execute(
-                    "SELECT id FROM user_notification_settings WHERE user_id = ?",
-                    (user_id,)
-                )
-                if not await check_cursor.fetchone():
-                    # 创建默认设置
-                    settings_id = str(int(datetime.now().timestamp() * 1000))
-                    now = datetime.now().isoformat()
-                    await db.execute("""
-                        INSERT INTO user_notification_settings 
-                        (id, user_id, created_at, updated_at)
-                        VALUES (?, ?, ?, ?)
-                    """, (settings_id, user_id, now, now))
-                    created_count += 1
+            now = datetime.now().isoformat()
+            await db.executemany("""
+                INSERT INTO user_notification_settings 
+                (id, user_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, [(_new_id(), row[0], now, now) for row in missing_users])
+            created_count = len(missing_users)
             
             if created_count > 0:
                 self.logger.info(f"为 {created_count} 个用户创建了默认通知设置")
@@ -343,7 +625,7 @@ class DatabaseManager:
         """添加或更新用户"""
         now = datetime.now().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             # 检查用户是否存在
             async with db.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
                 existing = await cursor.fetchone()
@@ -387,124 +669,113 @@ class DatabaseManager:
                     created_at=now,
                     last_active=now
                 )
-                
-                # 为新用户创建默认通知设置
-                await self.create_user_notification_settings(user_id)
             
             await db.commit()
+        
+        if not existing:
+            # 为新用户创建默认通知设置（需在用户写入提交后进行，避免跨连接锁等待）
+            await self.create_user_notification_settings(user_id)
             
         await self._log_user_action(user_id, "user_login", f"用户活跃: {username}")
         return user
     
     async def get_user(self, user_id: str) -> Optional[User]:
         """获取用户信息"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row:
-                    return User(
-                        id=row[0],
-                        username=row[1],
-                        first_name=row[2],
-                        last_name=row[3],
-                        is_admin=bool(row[4]),
-                        is_banned=bool(row[5]),
-                        created_at=row[6],
-                        last_active=row[7],
-                        total_monitors=row[8],
-                        total_notifications=row[9],
-                        daily_add_count=row[10],
-                        last_add_date=row[11],
-                        enable_notifications=bool(row[12]) if len(row) > 12 else True
-                    )
+                    return _row_to_user(row)
         return None
     
+    async def get_users_bulk(self, user_ids: Iterable[str]) -> Dict[str, User]:
+        """一次查询获取多个用户，返回 {用户ID: User}，不存在的用户不在结果中"""
+        user_ids = list(dict.fromkeys(user_ids))
+        users = {}
+        
+        async with self._connect() as db:
+            # 分批拼接占位符，避免超过 SQLite 的参数个数上限
+            for start in range(0, len(user_ids), self.IN_QUERY_BATCH_SIZE):
+                batch = user_ids[start:start + self.IN_QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                async with db.execute(
+                    f"SELECT * FROM users WHERE id IN ({placeholders})", batch
+                ) as cursor:
+                    for row in await cursor.fetchall():
+                        users[row[0]] = _row_to_user(row)
+        return users
+    
     async def set_user_admin(self, user_id: str, is_admin: bool, admin_user_id: str = "") -> bool:
         """设置用户管理员状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute(
                 "UPDATE users SET is_admin = ? WHERE id = ?", 
                 (1 if is_admin else 0, user_id)
             )
             await db.commit()
-            
-            if cursor.rowcount > 0:
-                action_data = f"设置管理员权限: {is_admin}"
-                await self._log_user_action(admin_user_id, "admin_set_user_admin", action_data)
-                return True
+        
+        if cursor.rowcount > 0:
+            action_data = f"设置管理员权限: {is_admin}"
+            await self._log_user_action(admin_user_id, "admin_set_user_admin", action_data)
+            return True
         return False
     
     async def ban_user(self, user_id: str, is_banned: bool, admin_user_id: str = "") -> bool:
         """封禁/解封用户"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute(
                 "UPDATE users SET is_banned = ? WHERE id = ?", 
                 (1 if is_banned else 0, user_id)
             )
             await db.commit()
-            
-            if cursor.rowcount > 0:
-                action_data = f"用户封禁状态: {is_banned}"
-                await self._log_user_action(admin_user_id, "admin_ban_user", action_data)
-                return True
+        
+        if cursor.rowcount > 0:
+            action_data = f"用户封禁状态: {is_banned}"
+            await self._log_user_action(admin_user_id, "admin_ban_user", action_data)
+            return True
         return False
     
     async def update_user_ban_status(self, user_id: str, is_banned: bool) -> bool:
         """更新用户封禁状态（简化版本，供 telegram_bot 调用）"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 cursor = await db.execute(
                     "UPDATE users SET is_banned = ? WHERE id = ?",
                     (1 if is_banned else 0, user_id)
                 )
                 await db.commit()
+            
+            if cursor.rowcount > 0:
+                # 记录操作日志
+                action_data = f"用户封禁状态更新: {'封禁' if is_banned else '解封'}"
+                await self._log_user_action("system", "update_ban_status", action_data)
+                return True
+            else:
+                self.logger.warning(f"未找到用户 {user_id}")
+                return False
                 
-                if cursor.rowcount > 0:
-                    # 记录操作日志
-                    action_data = f"用户封禁状态更新: {'封禁' if is_banned else '解封'}"
-                    await self._log_user_action("system", "update_ban_status", action_data)
-                    return True
-                else:
-                    self.logger.warning(f"未找到用户 {user_id}")
-                    return False
-                    
         except Exception as e:
             self.logger.error(f"更新用户封禁状态失败: {e}")
             return False
     
     async def get_all_users(self, include_banned: bool = False) -> List[User]:
         """获取所有用户"""
-        users = []
         sql = "SELECT * FROM users"
         if not include_banned:
             sql += " WHERE is_banned = 0"
         sql += " ORDER BY created_at DESC"
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute(sql) as cursor:
-                async for row in cursor:
-                    users.append(User(
-                        id=row[0],
-                        username=row[1],
-                        first_name=row[2],
-                        last_name=row[3],
-                        is_admin=bool(row[4]),
-                        is_banned=bool(row[5]),
-                        created_at=row[6],
-                        last_active=row[7],
-                        total_monitors=row[8],
-                        total_notifications=row[9],
-                        daily_add_count=row[10],
-                        last_add_date=row[11],
-                        enable_notifications=bool(row[12]) if len(row) > 12 else True
-                    ))
-        return users
+                rows = await cursor.fetchall()
+        
+        return [_row_to_user(row) for row in rows]
     
     # ===== 监控项管理方法 =====
     async def update_monitor_item_status(self, item_id: str, enabled: bool) -> bool:
         """更新监控项启用状态"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 cursor = await db.execute(
                     "UPDATE monitor_items SET enabled = ? WHERE id = ?",
                     (1 if enabled else 0, item_id)
@@ -512,6 +783,8 @@ class DatabaseManager:
                 await db.commit()
                 
                 if cursor.rowcount > 0:
+                    if self._items_cache is not None and item_id in self._items_cache:
+                        self._items_cache[item_id].enabled = enabled
                     self.logger.info(f"监控项 {item_id} 状态更新为: {'启用' if enabled else '禁用'}")
                     return True
                 else:
@@ -522,6 +795,65 @@ class DatabaseManager:
             self.logger.error(f"更新监控项状态失败: {e}")
             return False
     
+    async def update_item_check_statuses(self, rows: List[Tuple[str, bool, str]]) -> None:
+        """批量更新监控项的库存状态和最后检查时间
+        
+        每行: (item_id, status, checked_at)。缓冲中的检查历史在同一事务内一起写入，
+        一轮检查只提交一次。
+        """
+        if not rows:
+            return
+        
+        history_rows, self._history_buffer = self._history_buffer, []
+        try:
+            await self._write_check_results(history_rows, rows)
+        except Exception:
+            # 检查历史放回缓冲区，留给下次写入
+            self._history_buffer[:0] = history_rows
+            raise
+        
+        self._apply_statuses_to_cache(rows)
+    
+    async def queue_item_check_statuses(self, rows: List[Tuple[str, bool, str]]) -> None:
+        """缓冲监控项状态更新，由后台写入任务与检查历史一起提交
+        
+        缓存中的监控项立即更新，调用方无需等待数据库写入。未启动后台任务时直接写入。
+        """
+        if not rows:
+            return
+        
+        if self._history_flush_task is None:
+            await self.update_item_check_statuses(rows)
+            return
+        
+        for item_id, status, checked_at in rows:
+            self._status_buffer[item_id] = (status, checked_at)
+        self._apply_statuses_to_cache(rows)
+        self._history_flush_event.set()
+    
+    async def _write_check_results(self, history_rows: List[tuple],
+                                   status_rows: List[Tuple[str, bool, str]]) -> None:
+        """在一个事务中写入检查历史和监控项状态"""
+        async with self._connect() as db:
+            if history_rows:
+                await db.executemany(self._SQL_INSERT_HISTORY, history_rows)
+            if status_rows:
+                await db.executemany(
+                    "UPDATE monitor_items SET status = ?, last_checked = ? WHERE id = ?",
+                    [(1 if status else 0, checked_at, item_id) for item_id, status, checked_at in status_rows]
+                )
+            await db.commit()
+    
+    def _apply_statuses_to_cache(self, rows: List[Tuple[str, bool, str]]) -> None:
+        """把状态更新同步到监控项缓存"""
+        if self._items_cache is None:
+            return
+        for item_id, status, checked_at in rows:
+            item = self._items_cache.get(item_id)
+            if item is not None:
+                item.status = bool(status)
+                item.last_checked = checked_at
+    
     async def add_monitor_item(self, user_id: str, name: str, url: str, 
                              config: str = "", tags: List[str] = None, 
                              is_global: bool = False) -> Tuple[str, bool]:
@@ -535,11 +867,10 @@ class DatabaseManager:
         if not await self._check_daily_add_limit(user_id):
             return "", False
         
-        item_id = str(int(datetime.now().timestamp() * 1000))
-        created_at = datetime.now().isoformat()
+        item_id, created_at = _new_id_and_time()
         tags_json = json.dumps(tags or [])
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             # 检查URL是否已存在（对于该用户）
             if not is_global:
                 async with db.execute(
@@ -563,6 +894,8 @@ class DatabaseManager:
             
             await db.commit()
         
+        self._invalidate_items_cache()
+        
         await self._update_daily_add_count(user_id)
         await self._log_user_action(user_id, "add_monitor", f"添加监控: {name} - {url}")
         
@@ -571,77 +904,73 @@ class DatabaseManager:
     
     async def get_monitor_items(self, user_id: str = None, enabled_only: bool = True, 
                           include_global: bool = True) -> Dict[str, MonitorItem]:
-        """获取监控项"""
-        items = {}
+        """获取监控项（基于进程内缓存过滤）"""
+        items = await self._load_monitor_items()
         
-        sql = "SELECT * FROM monitor_items WHERE 1=1"
-        params = []
+        result = {}
+        for item_id, item in items.items():
+            if enabled_only and not item.enabled:
+                continue
+            if user_id and item.user_id != user_id and not (include_global and item.is_global):
+                continue
+            result[item_id] = item
+        return result
+    
+    async def _load_monitor_items(self) -> Dict[str, MonitorItem]:
+        """加载全部监控项，缓存有效时直接返回缓存
         
-        if enabled_only:
-            sql += " AND enabled = 1"
+        监控项只在添加/删除/修改时变化，这些操作会同步更新或清除缓存；
+        另设 TTL 兜底其他进程直接修改数据库的情况。
+        """
+        if (self._items_cache is not None
+                and time.monotonic() - self._items_cache_time < self.ITEMS_CACHE_TTL):
+            return self._items_cache
         
-        if user_id:
-            if include_global:
-                sql += " AND (user_id = ? OR is_global = 1)"
-                params.append(user_id)
-            else:
-                sql += " AND user_id = ?"
-                params.append(user_id)
-        
-        # 修改这里：改为升序排序（ASC），先添加的在前
-        sql += " ORDER BY created_at ASC"
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(sql, params) as cursor:
-                async for row in cursor:
-                    item = MonitorItem(
-                        id=row[0],
-                        user_id=row[1],
-                        name=row[2],
-                        url=row[3],
-                        config=row[4],
-                        created_at=row[5],
-                        last_checked=row[6],
-                        status=None if row[7] is None else bool(row[7]),
-                        notification_count=row[8],
-                        success_count=row[9],
-                        failure_count=row[10],
-                        last_error=row[11],
-                        tags=row[12],
-                        enabled=bool(row[13]),
-                        is_global=bool(row[14])
-                    )
-                    items[item.id] = item
+        # 按添加时间升序排序，先添加的在前
+        async with self._connect() as db:
+            async with db.execute(
+                f"SELECT {MONITOR_ITEM_COLUMNS} FROM monitor_items ORDER BY created_at ASC"
+            ) as cursor:
+                rows = await cursor.fetchall()
         
-        return items
+        self._items_cache = {row["id"]: _row_to_monitor_item(row) for row in rows}
+        self._items_cache_time = time.monotonic()
+        return self._items_cache
+    
+    def _invalidate_items_cache(self) -> None:
+        """清除监控项缓存"""
+        self._items_cache = None
     
     async def remove_monitor_item(self, item_id: str, user_id: str, 
                                 is_admin: bool = False) -> bool:
         """删除监控项"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # 检查权限
-            if is_admin:
-                # 管理员可以删除任何项目
-                async with db.execute("SELECT user_id FROM monitor_items WHERE id = ?", (item_id,)) as cursor:
-                    row = await cursor.fetchone()
-                    if not row:
-                        return False
-                    original_user_id = row[0]
-            else:
-                # 普通用户只能删除自己的项目
+        await self.flush()
+        
+        # 管理员可以删除任何项目，普通用户只能删除自己的项目
+        where = "id = ?" if is_admin else "id = ? AND user_id = ?"
+        params = (item_id,) if is_admin else (item_id, user_id)
+        
+        async with self._connect() as db:
+            if SUPPORTS_RETURNING:
+                # 权限检查与删除合并为一条语句
                 async with db.execute(
-                    "SELECT user_id FROM monitor_items WHERE id = ? AND user_id = ?", 
-                    (item_id, user_id)
+                    f"DELETE FROM monitor_items WHERE {where} RETURNING user_id", params
                 ) as cursor:
-                    if not await cursor.fetchone():
-                        return False
-                    original_user_id = user_id
+                    row = await cursor.fetchone()
+                if not row:
+                    return False
+            else:
+                async with db.execute(f"SELECT user_id FROM monitor_items WHERE {where}", params) as cursor:
+                    row = await cursor.fetchone()
+                if not row:
+                    return False
+                await db.execute("DELETE FROM monitor_items WHERE id = ?", (item_id,))
+            original_user_id = row[0]
             
             # 删除相关记录
             await db.execute("DELETE FROM check_history WHERE monitor_id = ?", (item_id,))
             await db.execute("DELETE FROM notification_history WHERE monitor_id = ?", (item_id,))
             await db.execute("DELETE FROM item_notification_history WHERE item_id = ?", (item_id,))
-            await db.execute("DELETE FROM monitor_items WHERE id = ?", (item_id,))
             
             # 更新用户统计
             await db.execute(
@@ -651,6 +980,9 @@ class DatabaseManager:
             
             await db.commit()
         
+        if self._items_cache is not None:
+            self._items_cache.pop(item_id, None)
+        
         await self._log_user_action(user_id, "remove_monitor", f"删除监控项: {item_id}")
         return True
     
@@ -659,26 +991,46 @@ class DatabaseManager:
     async def add_check_history(self, monitor_id: str, status: Optional[bool],
                               response_time: float, error_message: str = "",
                               http_status: int = 0, content_length: int = 0,
-                              confidence: float = 0.0, method_used: str = "") -> None:
-        """添加检查历史记录（增强版）"""
-        check_time = datetime.now().isoformat()
+                              confidence: float = 0.0, method_used: str = "",
+                              check_time: Optional[str] = None) -> None:
+        """添加检查历史记录（增强版）
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO check_history 
-                (monitor_id, check_time, status, response_time, error_message, 
-                 http_status, content_length, confidence, method_used)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (monitor_id, check_time, status, response_time, error_message, 
-                  http_status, content_length, confidence, method_used))
-            await db.commit()
+        初始化后记录先进入缓冲区，由后台任务批量写入。
+        check_time 为空时使用当前时间。
+        """
+        row = (monitor_id, check_time or datetime.now().isoformat(), status, response_time, error_message,
+               http_status, content_length, confidence, method_used)
+        
+        if self._history_flush_task is None:
+            await self.add_check_history_bulk([row])
+            return
+        
+        self._history_buffer.append(row)
+        if len(self._history_buffer) >= self.HISTORY_FLUSH_THRESHOLD:
+            self._history_flush_event.set()
+    
+    async def add_check_history_bulk(self, rows: List[tuple]) -> None:
+        """在单个事务中批量写入检查历史
+        
+        每行字段顺序: (monitor_id, check_time, status, response_time, error_message,
+        http_status, content_length, confidence, method_used)
+        """
+        if not rows:
+            return
+        
+        try:
+            async with self._connect() as db:
+                await db.executemany(self._SQL_INSERT_HISTORY, rows)
+                await db.commit()
+        except Exception as e:
+            self.logger.error(f"批量写入检查历史失败 ({len(rows)} 条): {e}")
     
     async def add_notification_history(self, user_id: str, monitor_id: str, 
                                      message: str, notification_type: str = "stock_alert") -> None:
         """添加通知历史"""
         sent_at = datetime.now().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 INSERT INTO notification_history 
                 (user_id, monitor_id, message, sent_at, notification_type)
@@ -693,11 +1045,40 @@ class DatabaseManager:
             
             await db.commit()
     
+    async def add_notification_history_bulk(self, rows: List[Tuple[str, str, str, str]]) -> None:
+        """在单个事务中批量添加通知历史
+        
+        每行: (user_id, monitor_id, message, notification_type)
+        """
+        if not rows:
+            return
+        
+        sent_at = datetime.now().isoformat()
+        user_counts: Dict[str, int] = {}
+        for row in rows:
+            user_counts[row[0]] = user_counts.get(row[0], 0) + 1
+        
+        async with self._connect() as db:
+            await db.executemany("""
+                INSERT INTO notification_history 
+                (user_id, monitor_id, message, sent_at, notification_type)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(user_id, monitor_id, message, sent_at, notification_type)
+                  for user_id, monitor_id, message, notification_type in rows])
+            
+            # 更新用户通知统计
+            await db.executemany(
+                "UPDATE users SET total_notifications = total_notifications + ? WHERE id = ?",
+                [(count, user_id) for user_id, count in user_counts.items()]
+            )
+            
+            await db.commit()
+    
     async def _log_user_action(self, user_id: str, action_type: str, action_data: str = "") -> None:
         """记录用户行为"""
         timestamp = datetime.now().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 INSERT INTO user_actions (user_id, action_type, action_data, timestamp)
                 VALUES (?, ?, ?, ?)
@@ -708,7 +1089,7 @@ class DatabaseManager:
         """检查每日添加限制"""
         today = datetime.now().date().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("""
                 SELECT daily_add_count, last_add_date FROM users WHERE id = ?
             """, (user_id,)) as cursor:
@@ -729,7 +1110,7 @@ class DatabaseManager:
         """更新每日添加计数"""
         today = datetime.now().date().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("""
                 SELECT daily_add_count, last_add_date FROM users WHERE id = ?
             """, (user_id,)) as cursor:
@@ -755,65 +1136,45 @@ class DatabaseManager:
     async def get_user_notification_settings(self, user_id: str) -> Optional[Dict[str, Any]]:
         """获取用户通知设置 - 修复版，返回字典格式"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute(
-                    "SELECT * FROM user_notification_settings WHERE user_id = ?", 
-                    (user_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    if row:
-                        return {
-                            'id': row[0],
-                            'user_id': row[1],
-                            'enable_notifications': bool(row[2]),
-                            'notification_cooldown': row[3],
-                            'max_daily_notifications': row[4],
-                            'quiet_hours_start': row[5],
-                            'quiet_hours_end': row[6],
-                            'last_notification_time': row[7],
-                            'daily_notification_count': row[8],
-                            'notification_date': row[9],
-                            'created_at': row[10],
-                            'updated_at': row[11]
-                        }
-                    else:
-                        # 如果不存在，尝试创建默认设置
-                        self.logger.info(f"为用户 {user_id} 创建默认通知设置")
-                        await self.create_user_notification_settings(user_id)
-                        
-                        # 重新查询
-                        async with db.execute(
-                            "SELECT * FROM user_notification_settings WHERE user_id = ?", 
-                            (user_id,)
-                        ) as cursor2:
-                            row2 = await cursor2.fetchone()
-                            if row2:
-                                return {
-                                    'id': row2[0],
-                                    'user_id': row2[1],
-                                    'enable_notifications': bool(row2[2]),
-                                    'notification_cooldown': row2[3],
-                                    'max_daily_notifications': row2[4],
-                                    'quiet_hours_start': row2[5],
-                                    'quiet_hours_end': row2[6],
-                                    'last_notification_time': row2[7],
-                                    'daily_notification_count': row2[8],
-                                    'notification_date': row2[9],
-                                    'created_at': row2[10],
-                                    'updated_at': row2[11]
-                                }
+            row = await self._fetch_notification_settings_row(user_id)
+            if not row:
+                # 如果不存在，尝试创建默认设置后重新查询
+                self.logger.info(f"为用户 {user_id} 创建默认通知设置")
+                await self.create_user_notification_settings(user_id)
+                row = await self._fetch_notification_settings_row(user_id)
+            
+            if row:
+                return {
+                    'id': row[0],
+                    'user_id': row[1],
+                    'enable_notifications': bool(row[2]),
+                    'notification_cooldown': row[3],
+                    'max_daily_notifications': row[4],
+                    'quiet_hours_start': row[5],
+                    'quiet_hours_end': row[6],
+                    'last_notification_time': row[7],
+                    'daily_notification_count': row[8],
+                    'notification_date': row[9],
+                    'created_at': row[10],
+                    'updated_at': row[11]
+                }
             return None
         except Exception as e:
             self.logger.error(f"获取用户通知设置失败: {e}")
             return None
     
+    async def _fetch_notification_settings_row(self, user_id: str) -> Optional[tuple]:
+        """查询用户通知设置原始记录"""
+        async with self._connect() as db:
+            async with db.execute(self._SQL_SELECT_NOTIFICATION_SETTINGS, (user_id,)) as cursor:
+                return await cursor.fetchone()
+    
     async def create_user_notification_settings(self, user_id: str) -> Dict[str, Any]:
         """创建默认用户通知设置 - 修复版"""
-        settings_id = str(int(datetime.now().timestamp() * 1000))
-        now = datetime.now().isoformat()
+        settings_id, now = _new_id_and_time()
         
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 await db.execute("""
                     INSERT INTO user_notification_settings 
                     (id, user_id, created_at, updated_at)
@@ -838,26 +1199,12 @@ class DatabaseManager:
             }
         except Exception as e:
             self.logger.error(f"创建用户通知设置失败: {e}")
-            # 返回默认设置即使数据库操作失败
-            return {
-                'id': settings_id,
-                'user_id': user_id,
-                'enable_notifications': True,
-                'notification_cooldown': 3600,
-                'max_daily_notifications': 10,
-                'quiet_hours_start': 23,
-                'quiet_hours_end': 7,
-                'last_notification_time': '',
-                'daily_notification_count': 0,
-                'notification_date': '',
-                'created_at': now,
-                'updated_at': now
-            }
+            raise
     
     async def update_notification_settings(self, user_id: str, **kwargs) -> bool:
         """更新用户通知设置 - 修复版"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 # 检查设置是否存在
                 async with db.execute(
                     "SELECT id FROM user_notification_settings WHERE user_id = ?",
@@ -867,8 +1214,7 @@ class DatabaseManager:
                 
                 if not existing:
                     # 创建新设置
-                    settings_id = str(int(datetime.now().timestamp() * 1000))
-                    now = datetime.now().isoformat()
+                    settings_id, now = _new_id_and_time()
                     
                     await db.execute("""
                         INSERT INTO user_notification_settings 
@@ -876,35 +1222,20 @@ class DatabaseManager:
                         VALUES (?, ?, ?, ?)
                     """, (settings_id, user_id, now, now))
                 
-                # 构建更新语句
-                update_fields = []
-                values = []
-                
-                field_mapping = {
-                    'enable_notifications': 'enable_notifications',
-                    'notification_cooldown': 'notification_cooldown',
-                    'max_daily_notifications': 'max_daily_notifications',
-                    'quiet_hours_start': 'quiet_hours_start',
-                    'quiet_hours_end': 'quiet_hours_end'
-                }
-                
-                for key, value in kwargs.items():
-                    if key in field_mapping:
-                        update_fields.append(f"{field_mapping[key]} = ?")
-                        # 处理布尔值
-                        if key == 'enable_notifications':
-                            values.append(1 if value else 0)
-                        else:
-                            values.append(value)
+                # 固定的更新语句：未提供的字段绑定 NULL，由 COALESCE 保留原值
+                enable = kwargs.get('enable_notifications')
+                values = (
+                    None if enable is None else (1 if enable else 0),
+                    kwargs.get('notification_cooldown'),
+                    kwargs.get('max_daily_notifications'),
+                    kwargs.get('quiet_hours_start'),
+                    kwargs.get('quiet_hours_end'),
+                    datetime.now().isoformat(),
+                    user_id
+                )
                 
-                if update_fields:
-                    values.extend([datetime.now().isoformat(), user_id])
-                    sql = f"""
-                        UPDATE user_notification_settings 
-                        SET {', '.join(update_fields)}, updated_at = ?
-                        WHERE user_id = ?
-                    """
-                    cursor = await db.execute(sql, values)
+                if any(value is not None for value in values[:5]):
+                    cursor = await db.execute(SQL_UPDATE_NOTIFICATION_SETTINGS, values)
                     await db.commit()
                     
                     if cursor.rowcount > 0:
@@ -925,34 +1256,33 @@ class DatabaseManager:
         """更新用户通知设置 - 兼容性方法"""
         return await self.update_notification_settings(user_id, **settings_dict)
     
-    async def update_notification_record(self, user_id: str) -> None:
+    async def update_notification_record(self, user_id: str, ctx: Optional[SweepContext] = None) -> None:
         """更新通知记录"""
-        now = datetime.now()
-        today = now.date().isoformat()
+        ctx = ctx or SweepContext.create()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 UPDATE user_notification_settings 
                 SET last_notification_time = ?,
                     daily_notification_count = daily_notification_count + 1,
                     notification_date = ?
                 WHERE user_id = ?
-            """, (now.isoformat(), today, user_id))
+            """, (ctx.now_iso, ctx.today, user_id))
             await db.commit()
     
-    async def reset_daily_notification_count(self, user_id: str) -> bool:
+    async def reset_daily_notification_count(self, user_id: str, ctx: Optional[SweepContext] = None) -> bool:
         """重置每日通知计数 - 修复版"""
         try:
-            today = datetime.now().date().isoformat()
+            ctx = ctx or SweepContext.create()
             
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 cursor = await db.execute("""
                     UPDATE user_notification_settings 
                     SET daily_notification_count = 0,
                         notification_date = ?,
                         updated_at = ?
                     WHERE user_id = ?
-                """, (today, datetime.now().isoformat(), user_id))
+                """, (ctx.today, ctx.now_iso, user_id))
                 await db.commit()
                 
                 if cursor.rowcount > 0:
@@ -966,7 +1296,8 @@ class DatabaseManager:
             self.logger.error(f"重置每日通知计数失败: {e}")
             return False
     
-    async def check_can_notify_user(self, user_id: str, item_id: str) -> bool:
+    async def check_can_notify_user(self, user_id: str, item_id: str,
+                                    ctx: Optional[SweepContext] = None) -> bool:
         """检查是否可以发送通知给用户 - 修复版"""
         try:
             # 检查用户是否启用通知
@@ -980,78 +1311,165 @@ class DatabaseManager:
                 # 如果没有设置，创建默认设置
                 settings = await self.create_user_notification_settings(user_id)
             
-            if not settings.get('enable_notifications', True):
-                return False
+            # 检查每日限制（新的一天先重置计数）
+            ctx = ctx or SweepContext.create()
+            if settings.get('notification_date', '') != ctx.today:
+                await self.reset_daily_notification_count(user_id, ctx)
+                settings = {**settings, 'daily_notification_count': 0}
             
-            # 检查免打扰时间
-            current_hour = datetime.now().hour
-            quiet_start = settings.get('quiet_hours_start', 23)
-            quiet_end = settings.get('quiet_hours_end', 7)
+            # 获取该商品最近一次通知时间，用于冷却判断
+            async with self._connect() as db:
+                async with db.execute(self._SQL_SELECT_LAST_ITEM_NOTIFICATION, (user_id, item_id)) as cursor:
+                    row = await cursor.fetchone()
             
-            # 如果免打扰时间设置为无效值（如25），表示关闭免打扰
-            if quiet_start < 24 and quiet_end < 24:
-                if quiet_start > quiet_end:
-                    # 跨午夜的情况
-                    if current_hour >= quiet_start or current_hour < quiet_end:
-                        self.logger.debug(f"用户 {user_id} 在免打扰时间内 ({quiet_start}:00-{quiet_end}:00)")
-                        return False
-                else:
-                    if quiet_start <= current_hour < quiet_end:
-                        self.logger.debug(f"用户 {user_id} 在免打扰时间内 ({quiet_start}:00-{quiet_end}:00)")
-                        return False
+            return self._passes_notification_gates(
+                user_id, item_id, settings, row[0] if row else None, ctx
+            )
             
-            # 检查每日限制
-            today = datetime.now().date().isoformat()
-            notification_date = settings.get('notification_date', '')
-            daily_count = settings.get('daily_notification_count', 0)
-            max_daily = settings.get('max_daily_notifications', 10)
+        except Exception as e:
+            self.logger.error(f"检查通知权限失败: {e}")
+            return False
+    
+    async def filter_notifiable(self, item_ids: List[str],
+                                ctx: Optional[SweepContext] = None) -> List[str]:
+        """批量检查通知权限，返回其所属用户当前可接收通知的监控项ID
+        
+        与 check_can_notify_user 的判断规则一致，但一次查询取回所有监控项的
+        所属用户、通知设置以及该商品最近一次通知时间，在内存中完成判断。
+        """
+        if not item_ids:
+            return []
+        
+        try:
+            ctx = ctx or SweepContext.create()
+            rows = []
             
-            if notification_date != today:
-                # 新的一天，重置计数
-                await self.reset_daily_notification_count(user_id)
-                daily_count = 0
+            async with self._connect() as db:
+                # 分批拼接占位符，避免超过 SQLite 的参数个数上限
+                for start in range(0, len(item_ids), self.IN_QUERY_BATCH_SIZE):
+                    batch = item_ids[start:start + self.IN_QUERY_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    async with db.execute(f"""
+                        SELECT 
+                            m.id,
+                            m.user_id,
+                            u.enable_notifications,
+                            s.user_id,
+                            s.enable_notifications,
+                            s.notification_cooldown,
+                            s.max_daily_notifications,
+                            s.quiet_hours_start,
+                            s.quiet_hours_end,
+                            s.daily_notification_count,
+                            s.notification_date,
+                            (SELECT MAX(h.notification_time)
+                             FROM item_notification_history h
+                             WHERE h.user_id = m.user_id AND h.item_id = m.id)
+                        FROM monitor_items m
+                        JOIN users u ON u.id = m.user_id
+                        LEFT JOIN user_notification_settings s ON s.user_id = m.user_id
+                        WHERE m.id IN ({placeholders})
+                    """, batch) as cursor:
+                        rows.extend(await cursor.fetchall())
             
-            if daily_count >= max_daily:
-                self.logger.debug(f"用户 {user_id} 已达每日通知限制 ({daily_count}/{max_daily})")
-                return False
+            notifiable = []
+            missing_settings = set()
+            stale_users = set()
             
-            # 检查该商品的冷却时间
-            cooldown_seconds = settings.get('notification_cooldown', 3600)
+            for row in rows:
+                item_id, user_id, user_enabled = row[0], row[1], row[2]
+                if not user_enabled:
+                    continue
+                
+                if row[3] is None:
+                    # 没有设置，按默认值判断并在稍后创建
+                    missing_settings.add(user_id)
+                    settings = {}
+                else:
+                    settings = {
+                        'enable_notifications': bool(row[4]),
+                        'notification_cooldown': row[5],
+                        'max_daily_notifications': row[6],
+                        'quiet_hours_start': row[7],
+                        'quiet_hours_end': row[8],
+                        'daily_notification_count': row[9],
+                        'notification_date': row[10]
+                    }
+                    if row[10] != ctx.today:
+                        # 新的一天，重置计数
+                        stale_users.add(user_id)
+                        settings['daily_notification_count'] = 0
+                
+                if self._passes_notification_gates(user_id, item_id, settings, row[11], ctx):
+                    notifiable.append((item_id, user_id))
             
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute("""
-                    SELECT notification_time 
-                    FROM item_notification_history 
-                    WHERE user_id = ? AND item_id = ?
-                    ORDER BY notification_time DESC
-                    LIMIT 1
-                """, (user_id, item_id)) as cursor:
-                    row = await cursor.fetchone()
-                    
-                    if row:
-                        last_notification = datetime.fromisoformat(row[0])
-                        time_diff = (datetime.now() - last_notification).total_seconds()
-                        if time_diff < cooldown_seconds:
-                            self.logger.debug(f"商品 {item_id} 仍在冷却时间内，剩余 {cooldown_seconds - time_diff:.0f} 秒")
-                            return False
+            for user_id in stale_users:
+                await self.reset_daily_notification_count(user_id, ctx)
             
-            return True
+            failed_users = set()
+            for user_id in missing_settings:
+                try:
+                    await self.create_user_notification_settings(user_id)
+                except Exception:
+                    # 只跳过该用户的监控项，不影响本轮其他用户
+                    failed_users.add(user_id)
+            
+            return [item_id for item_id, user_id in notifiable if user_id not in failed_users]
             
         except Exception as e:
-            self.logger.error(f"检查通知权限失败: {e}")
+            self.logger.error(f"批量检查通知权限失败: {e}")
+            return []
+    
+    def _passes_notification_gates(self, user_id: str, item_id: str, settings: Dict[str, Any],
+                                   last_notification_time: Optional[str],
+                                   ctx: SweepContext) -> bool:
+        """按通知开关、免打扰时间、每日限制和商品冷却时间判断是否可以通知"""
+        if not settings.get('enable_notifications', True):
             return False
+        
+        quiet_start = settings.get('quiet_hours_start', 23)
+        quiet_end = settings.get('quiet_hours_end', 7)
+        
+        # 如果免打扰时间设置为无效值（如25），表示关闭免打扰
+        if quiet_start < 24 and quiet_end < 24:
+            if quiet_start > quiet_end:
+                # 跨午夜的情况
+                if ctx.hour >= quiet_start or ctx.hour < quiet_end:
+                    self.logger.debug(f"用户 {user_id} 在免打扰时间内 ({quiet_start}:00-{quiet_end}:00)")
+                    return False
+            else:
+                if quiet_start <= ctx.hour < quiet_end:
+                    self.logger.debug(f"用户 {user_id} 在免打扰时间内 ({quiet_start}:00-{quiet_end}:00)")
+                    return False
+        
+        daily_count = settings.get('daily_notification_count', 0)
+        max_daily = settings.get('max_daily_notifications', 10)
+        if daily_count >= max_daily:
+            self.logger.debug(f"用户 {user_id} 已达每日通知限制 ({daily_count}/{max_daily})")
+            return False
+        
+        if last_notification_time:
+            cooldown_seconds = settings.get('notification_cooldown', 3600)
+            time_diff = (ctx.now - datetime.fromisoformat(last_notification_time)).total_seconds()
+            if time_diff < cooldown_seconds:
+                self.logger.debug(f"商品 {item_id} 仍在冷却时间内，剩余 {cooldown_seconds - time_diff:.0f} 秒")
+                return False
+        
+        return True
     
-    async def add_item_notification_history(self, user_id: str, item_id: str, status: bool) -> None:
+    async def add_item_notification_history(self, user_id: str, item_id: str, status: bool,
+                                            ctx: Optional[SweepContext] = None) -> None:
         """添加商品通知历史记录"""
-        history_id = str(int(datetime.now().timestamp() * 1000))
-        now = datetime.now().isoformat()
+        history_id, notification_time = _new_id_and_time()
+        if ctx:
+            notification_time = ctx.now_iso
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 INSERT INTO item_notification_history 
                 (id, user_id, item_id, notification_time, status)
                 VALUES (?, ?, ?, ?, ?)
-            """, (history_id, user_id, item_id, now, 1 if status else 0))
+            """, (history_id, user_id, item_id, notification_time, 1 if status else 0))
             await db.commit()
     
     # ===== 统计和分析方法 =====
@@ -1061,7 +1479,7 @@ class DatabaseManager:
         since_date = (datetime.now() - timedelta(days=days)).isoformat()
         stats = {}
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             # 用户基本信息
             async with db.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
                 user_row = await cursor.fetchone()
@@ -1102,10 +1520,7 @@ class DatabaseManager:
                 GROUP BY action_type
                 ORDER BY count DESC
             """, (user_id, since_date)) as cursor:
-                activities = {}
-                async for row in cursor:
-                    activities[row[0]] = row[1]
-                stats['recent_activities'] = activities
+                stats['recent_activities'] = dict(await cursor.fetchall())
         
         return stats
     
@@ -1114,7 +1529,7 @@ class DatabaseManager:
         since_date = (datetime.now() - timedelta(days=days)).isoformat()
         stats = {}
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             # 用户统计
             async with db.execute("""
                 SELECT 
@@ -1152,15 +1567,17 @@ class DatabaseManager:
                     }
             
             # 检查统计
+            # 总数和平均值走覆盖索引，成功数走 status = 1 的部分索引
             async with db.execute("""
                 SELECT 
                     COUNT(*) as total_checks,
-                    COUNT(CASE WHEN status = 1 THEN 1 END) as successful_checks,
+                    (SELECT COUNT(*) FROM check_history 
+                     WHERE check_time >= ? AND status = 1) as successful_checks,
                     AVG(response_time) as avg_response_time,
                     AVG(confidence) as avg_confidence
                 FROM check_history 
                 WHERE check_time >= ?
-            """, (since_date,)) as cursor:
+            """, (since_date, since_date)) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     stats['checks'] = {
@@ -1184,13 +1601,14 @@ class DatabaseManager:
                 ORDER BY activity_count DESC
                 LIMIT 10
             """, (since_date,)) as cursor:
-                top_users = []
-                async for row in cursor:
-                    top_users.append({
+                rows = await cursor.fetchall()
+                stats['top_users'] = [
+                    {
                         'username': row[0] or row[1] or 'Unknown',
                         'activity_count': row[2]
-                    })
-                stats['top_users'] = top_users
+                    }
+                    for row in rows
+                ]
         
         return stats
     
@@ -1200,7 +1618,7 @@ class DatabaseManager:
         """设置系统配置"""
         updated_at = datetime.now().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 INSERT OR REPLACE INTO system_config (key, value, updated_at, updated_by)
                 VALUES (?, ?, ?, ?)
@@ -1209,7 +1627,7 @@ class DatabaseManager:
     
     async def get_system_config(self, key: str, default_value: str = "") -> str:
         """获取系统配置"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("SELECT value FROM system_config WHERE key = ?", (key,)) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else default_value
@@ -1218,61 +1636,113 @@ class DatabaseManager:
     
     async def cleanup_old_data(self, days: int = 90) -> Dict[str, int]:
         """清理旧数据"""
+        await self.flush()
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         cleanup_stats = {}
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # 清理旧的检查历史
-            cursor = await db.execute(
-                "DELETE FROM check_history WHERE check_time < ?", 
-                (cutoff_date,)
-            )
-            cleanup_stats['check_history'] = cursor.rowcount
-            
-            # 清理旧的用户行为日志
-            cursor = await db.execute(
-                "DELETE FROM user_actions WHERE timestamp < ?", 
-                (cutoff_date,)
-            )
-            cleanup_stats['user_actions'] = cursor.rowcount
+        for table, time_column in self.CLEANUP_TARGETS:
+            cleanup_stats[table] = await self._delete_before(table, time_column, cutoff_date)
+        
+        if any(cleanup_stats.values()):
+            await self._reclaim_free_pages()
+        
+        self.logger.info(f"数据清理完成: {cleanup_stats}")
+        return cleanup_stats
+    
+    async def _delete_before(self, table: str, time_column: str, cutoff: str) -> int:
+        """分批删除早于 cutoff 的记录，每批单独提交并让出事件循环，避免长时间占用写锁"""
+        sql = (
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} WHERE {time_column} < ? LIMIT ?)"
+        )
+        deleted_count = 0
+        while True:
+            async with self._connect() as db:
+                cursor = await db.execute(sql, (cutoff, self.CLEANUP_BATCH_SIZE))
+                await db.commit()
+            if cursor.rowcount <= 0:
+                break
+            deleted_count += cursor.rowcount
+            await asyncio.sleep(0)
+        return deleted_count
+    
+    async def _reclaim_free_pages(self) -> None:
+        """把删除后留下的空闲页归还给文件系统
+        
+        DELETE 只把页面放回空闲列表，文件不会变小。auto_vacuum=INCREMENTAL 下
+        分批执行 incremental_vacuum，每批之间让出事件循环；其他模式直接跳过，
+        旧库的转换由管理员通过 enable_incremental_vacuum 显式执行。
+        """
+        try:
+            async with self._connect() as db:
+                async with db.execute("PRAGMA auto_vacuum") as cursor:
+                    mode = (await cursor.fetchone())[0]
+            if mode != self.AUTO_VACUUM_INCREMENTAL:
+                self.logger.info("数据库未启用增量 VACUUM，跳过空闲页回收（可在管理面板中手动启用）")
+                return
             
-            # 清理旧的通知历史
-            cursor = await db.execute(
-                "DELETE FROM notification_history WHERE sent_at < ?", 
-                (cutoff_date,)
-            )
-            cleanup_stats['notification_history'] = cursor.rowcount
+            while True:
+                async with self._connect() as db:
+                    async with db.execute("PRAGMA freelist_count") as cursor:
+                        free_pages = (await cursor.fetchone())[0]
+                    if free_pages == 0:
+                        break
+                    # incremental_vacuum 每释放一页返回一行，需要取完才会执行完整
+                    await db.execute_fetchall(
+                        f"PRAGMA incremental_vacuum({self.VACUUM_BATCH_PAGES})"
+                    )
+                await asyncio.sleep(0)
+        except Exception as e:
+            self.logger.error(f"回收空闲页失败: {e}")
+    
+    async def enable_incremental_vacuum(self) -> Tuple[bool, str]:
+        """把已有数据库转换为 auto_vacuum=INCREMENTAL（管理员手动执行）
+        
+        转换需要一次完整 VACUUM：期间所有数据库操作都会等待，并且需要约两倍
+        数据库大小的空闲磁盘空间。返回 (是否成功, 说明)。
+        """
+        await self.flush()
+        
+        async with self._connect() as db:
+            async with db.execute("PRAGMA auto_vacuum") as cursor:
+                mode = (await cursor.fetchone())[0]
+            if mode == self.AUTO_VACUUM_INCREMENTAL:
+                return True, "数据库已启用增量 VACUUM"
             
-            # 清理旧的商品通知历史
-            cursor = await db.execute(
-                "DELETE FROM item_notification_history WHERE notification_time < ?", 
-                (cutoff_date,)
-            )
-            cleanup_stats['item_notification_history'] = cursor.rowcount
+            db_size = os.path.getsize(self.db_path)
+            free_space = shutil.disk_usage(os.path.dirname(os.path.abspath(self.db_path))).free
+            if free_space < db_size * 2:
+                return False, f"磁盘空间不足：需要约 {db_size * 2 // 1024 // 1024}MB，可用 {free_space // 1024 // 1024}MB"
             
-            await db.commit()
+            try:
+                self.logger.info("开始转换数据库为增量 VACUUM 模式")
+                await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                await db.execute("VACUUM")
+            except Exception as e:
+                self.logger.error(f"转换增量 VACUUM 失败: {e}")
+                return False, f"转换失败: {e}"
         
-        self.logger.info(f"数据清理完成: {cleanup_stats}")
-        return cleanup_stats
+        self.logger.info("数据库已转换为增量 VACUUM 模式")
+        return True, "已启用增量 VACUUM"
     
     async def clear_user_monitors(self, user_id: str, admin_user_id: str = "") -> int:
         """清空用户所有监控项（管理员功能）"""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self.flush()
+        
+        async with self._connect() as db:
             # 获取要删除的监控项
-            monitor_ids = []
             async with db.execute(
                 "SELECT id FROM monitor_items WHERE user_id = ?", 
                 (user_id,)
             ) as cursor:
-                async for row in cursor:
-                    monitor_ids.append(row[0])
+                monitor_ids = [row[0] for row in await cursor.fetchall()]
             
             if monitor_ids:
-                # 删除相关记录
-                for monitor_id in monitor_ids:
-                    await db.execute("DELETE FROM check_history WHERE monitor_id = ?", (monitor_id,))
-                    await db.execute("DELETE FROM notification_history WHERE monitor_id = ?", (monitor_id,))
-                    await db.execute("DELETE FROM item_notification_history WHERE item_id = ?", (monitor_id,))
+                # 删除相关记录（每张表一条语句）
+                user_items = "SELECT id FROM monitor_items WHERE user_id = ?"
+                await db.execute(f"DELETE FROM check_history WHERE monitor_id IN ({user_items})", (user_id,))
+                await db.execute(f"DELETE FROM notification_history WHERE monitor_id IN ({user_items})", (user_id,))
+                await db.execute(f"DELETE FROM item_notification_history WHERE item_id IN ({user_items})", (user_id,))
                 
                 # 删除监控项
                 await db.execute("DELETE FROM monitor_items WHERE user_id = ?", (user_id,))
@@ -1281,11 +1751,13 @@ class DatabaseManager:
                 await db.execute("UPDATE users SET total_monitors = 0 WHERE id = ?", (user_id,))
                 
                 await db.commit()
-            
-            await self._log_user_action(admin_user_id, "admin_clear_user_monitors", 
-                                      f"清空用户 {user_id} 的所有监控项")
-            
-            return len(monitor_ids)
+        
+        self._invalidate_items_cache()
+        
+        await self._log_user_action(admin_user_id, "admin_clear_user_monitors", 
+                                  f"清空用户 {user_id} 的所有监控项")
+        
+        return len(monitor_ids)
 
 
 # 使用示例
@@ -1293,41 +1765,51 @@ async def example_usage():
     """多用户版本使用示例"""
     db_manager = DatabaseManager("vps_monitor.db")
     
-    # 初始化数据库
-    await db_manager.initialize()
-    
-    # 添加用户
-    user = await db_manager.add_or_update_user(
-        user_id="123456789",
-        username="testuser",
-        first_name="Test",
-        last_name="User"
-    )
-    print(f"用户: {user.username}")
-    
-    # 添加监控项
-    item_id, success = await db_manager.add_monitor_item(
-        user_id="123456789",
-        name="测试VPS",
-        url="https://example.com/vps",
-        config="2GB RAM, 20GB SSD",
-        tags=["vps", "test"]
-    )
-    
-    if success:
-        print(f"监控项添加成功: {item_id}")
-    
-    # 获取用户统计
-    stats = await db_manager.get_user_statistics("123456789")
-    print(f"用户统计: {stats}")
-    
-    # 测试用户通知功能
-    settings = await db_manager.get_user_notification_settings("123456789")
-    if not settings:
-        settings = await db_manager.create_user_notification_settings("123456789")
-    
-    print(f"通知设置: {settings}")
+    try:
+        # 初始化数据库
+        await db_manager.initialize()
+        
+        # 添加用户
+        user = await db_manager.add_or_update_user(
+            user_id="123456789",
+            username="testuser",
+            first_name="Test",
+            last_name="User"
+        )
+        print(f"用户: {user.username}")
+        
+        # 添加监控项
+        item_id, success = await db_manager.add_monitor_item(
+            user_id="123456789",
+            name="测试VPS",
+            url="https://example.com/vps",
+            config="2GB RAM, 20GB SSD",
+            tags=["vps", "test"]
+        )
+        
+        if success:
+            print(f"监控项添加成功: {item_id}")
+        
+        # 获取用户统计
+        stats = await db_manager.get_user_statistics("123456789")
+        print(f"用户统计: {stats}")
+        
+        # 测试用户通知功能
+        settings = await db_manager.get_user_notification_settings("123456789")
+        if not settings:
+            settings = await db_manager.create_user_notification_settings("123456789")
+        
+        print(f"通知设置: {settings}")
+    finally:
+        # 关闭长连接及后台任务，否则进程无法退出
+        await db_manager.close()
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(example_usage())
@@ -5,30 +5,82 @@ VPS监控系统 v3.1
 """
 
 import asyncio
-import aiosqlite
 import logging
+import sys
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from config import Config, ConfigManager
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, SweepContext, User
 from telegram_bot import TelegramBot
 from monitors import SmartComboMonitor
 from utils import check_dependencies
 
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = sys.platform != 'win32'
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+
+def install_event_loop_policy() -> bool:
+    """在 asyncio.run 之前调用：可用时改用 uvloop 事件循环，返回是否已安装"""
+    if not UVLOOP_AVAILABLE:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+# 启动通知模板，{config} 为当前 Config
+STARTUP_MESSAGE_TEMPLATE = (
+    "🚀 **VPS监控程序 v3.1 已启动** (多用户版)\n\n"
+    "🆕 **v3.1新特性:**\n"
+    "🧠 智能组合监控算法\n"
+    "🎯 多重检测方法验证\n"
+    "📊 置信度评分系统\n"
+    "👥 多用户支持系统\n"
+    "🛡️ 服务商优化模块\n"
+    "🧩 完整管理员工具\n"
+    "🔧 集成调试功能\n\n"
+    "⚙️ **系统配置:**\n"
+    "⏰ 检查间隔：{config.check_interval}秒\n"
+    "📊 聚合间隔：{config.notification_aggregation_interval}秒\n"
+    "🕐 通知冷却：{config.notification_cooldown}秒\n"
+    "🎯 置信度阈值：{config.confidence_threshold}\n"
+    "📈 每日添加限制：{config.daily_add_limit}\n\n"
+    "👥 **多用户特性:**\n"
+    "• 所有用户都可添加监控\n"
+    "• 库存变化推送给管理员\n"
+    "• 用户行为统计和管理\n"
+    "• 智能防刷机制\n"
+    "• 完整的管理员工具\n\n"
+    "💡 使用 /start 开始操作\n"
+    "🔍 使用 /debug <URL> 进行调试\n"
+    "🧩 管理员可使用 /admin 管理\n\n"
+    "👨‍💻 作者: kure29 | https://kure29.com"
+)
+
 
 class VPSMonitor:
     """主监控类（v3.1多用户版）"""
     
+    # 同时发送给不同用户的通知数上限（Telegram 群发约30条/秒）
+    NOTIFY_CONCURRENCY = 25
+    
     def __init__(self):
         self.config_manager = ConfigManager()
         self.db_manager = DatabaseManager()
         self.stock_checker = None
         self.telegram_bot = None
         self.logger = logging.getLogger(__name__)
-        self._running = False
-        self._pending_notifications = []
-        self._last_aggregation_time = datetime.now()
-        self._last_notified = {}
+        # 停止请求：置位后监控循环立即结束等待并退出
+        self._stop_event = asyncio.Event()
+        self._notification_queue: Optional[asyncio.Queue] = None
+        self._aggregator_task: Optional[asyncio.Task] = None
+        # 冷却计时使用单调时钟秒数，不受系统时间调整影响
+        self._last_aggregation_time = time.monotonic()
+        self._last_notified: Dict[str, float] = {}
+        self._check_semaphore: Optional[asyncio.Semaphore] = None
     
     async def initialize(self) -> None:
         """初始化监控器"""
@@ -48,11 +100,16 @@ class VPSMonitor:
             
             # 初始化智能监控器
             self.stock_checker = SmartComboMonitor(config)
-            self.telegram_bot = TelegramBot(config, self.db_manager)
+            self._check_semaphore = asyncio.Semaphore(max(1, config.max_concurrent_checks))
+            self.telegram_bot = TelegramBot(config, self.db_manager, self.stock_checker)
             
             # 初始化Telegram Bot
             await self.telegram_bot.initialize()
             
+            # 通知聚合任务：检查循环只负责入队，到达聚合间隔即发送
+            self._notification_queue = asyncio.Queue()
+            self._aggregator_task = asyncio.create_task(self._aggregator_loop())
+            
             # 显示功能状态
             print(f"🤖 Selenium支持: {'✅' if dependencies.get('selenium') and config.enable_selenium else '❌'}")
             print(f"🔍 API发现: {'✅' if config.enable_api_discovery else '❌'}")
@@ -77,46 +134,12 @@ class VPSMonitor:
             
             # 发送启动通知 - 修改为只通知管理员
             config = self.config_manager.config
-            startup_message = (
-                "🚀 **VPS监控程序 v3.1 已启动** (多用户版)\n\n"
-                "🆕 **v3.1新特性:**\n"
-                "🧠 智能组合监控算法\n"
-                "🎯 多重检测方法验证\n"
-                "📊 置信度评分系统\n"
-                "👥 多用户支持系统\n"
-                "🛡️ 服务商优化模块\n"
-                "🧩 完整管理员工具\n"
-                "🔧 集成调试功能\n\n"
-                f"⚙️ **系统配置:**\n"
-                f"⏰ 检查间隔：{config.check_interval}秒\n"
-                f"📊 聚合间隔：{config.notification_aggregation_interval}秒\n"
-                f"🕐 通知冷却：{config.notification_cooldown}秒\n"
-                f"🎯 置信度阈值：{config.confidence_threshold}\n"
-                f"📈 每日添加限制：{config.daily_add_limit}\n\n"
-                f"👥 **多用户特性:**\n"
-                f"• 所有用户都可添加监控\n"
-                f"• 库存变化推送给管理员\n"
-                f"• 用户行为统计和管理\n"
-                f"• 智能防刷机制\n"
-                f"• 完整的管理员工具\n\n"
-                "💡 使用 /start 开始操作\n"
-                "🔍 使用 /debug <URL> 进行调试\n"
-                "🧩 管理员可使用 /admin 管理\n\n"
-                "👨‍💻 作者: kure29 | https://kure29.com"
-            )
+            startup_message = STARTUP_MESSAGE_TEMPLATE.format(config=config)
             
             # 只发送给管理员
             if config.admin_ids:
-                for admin_id in config.admin_ids:
-                    try:
-                        await self.telegram_bot.send_notification(
-                            startup_message, 
-                            parse_mode='Markdown', 
-                            chat_id=admin_id
-                        )
-                        self.logger.info(f"启动通知已发送给管理员: {admin_id}")
-                    except Exception as e:
-                        self.logger.error(f"发送启动通知给管理员 {admin_id} 失败: {e}")
+                await self._notify_admins(startup_message, parse_mode='Markdown')
+                self.logger.info(f"启动通知已发送给 {len(config.admin_ids)} 个管理员")
             else:
                 # 如果没有配置管理员，发送到默认频道
                 await self.telegram_bot.send_notification(startup_message, parse_mode='Markdown')
@@ -126,9 +149,8 @@ class VPSMonitor:
             await self._perform_startup_check()
             
             # 开始监控循环
-            self._running = True
             print("✅ 多用户智能监控系统启动成功，按Ctrl+C停止")
-            await self._monitor_loop()
+            await self._run_loops()
             
         except KeyboardInterrupt:
             print("\n🛑 收到停止信号")
@@ -146,62 +168,49 @@ class VPSMonitor:
         items = await self.db_manager.get_monitor_items(enabled_only=True)
         if not items:
             # 只通知管理员
-            config = self.config_manager.config
-            if config.admin_ids:
-                for admin_id in config.admin_ids:
-                    await self.telegram_bot.send_notification("⚠️ 当前没有监控商品", chat_id=admin_id)
+            await self._notify_admins("⚠️ 当前没有监控商品")
             print("⚠️ 当前没有监控商品")
             return
         
         print(f"🔍 开始智能检查 {len(items)} 个监控项...")
         
         # 只通知管理员
-        config = self.config_manager.config
-        if config.admin_ids:
-            for admin_id in config.admin_ids:
-                await self.telegram_bot.send_notification("🧠 正在进行智能启动检查...", chat_id=admin_id)
+        await self._notify_admins("🧠 正在进行智能启动检查...")
         
         success_count = 0
         fail_count = 0
         low_confidence_count = 0
         
-        for item in items.values():
-            try:
-                print(f"智能检查: {item.name} (用户: {item.user_id})")
-                stock_available, error, check_info = await self.stock_checker.check_stock(item.url)
-                
-                # 记录检查历史
-                await self.db_manager.add_check_history(
-                    monitor_id=item.id,
-                    status=stock_available,
-                    response_time=check_info['response_time'],
-                    error_message=error or '',
-                    http_status=check_info['http_status'],
-                    content_length=check_info['content_length'],
-                    confidence=check_info.get('confidence', 0),
-                    method_used=check_info.get('method', 'SMART_COMBO')
-                )
-                
-                if error:
-                    fail_count += 1
-                    print(f"  ❌ 检查失败: {error}")
+        results = await self._check_items(items)
+        status_rows = []
+        
+        # 逐项结果只写 DEBUG 日志（参数延迟格式化），控制台只输出最后的汇总
+        for item, result in zip(items.values(), results):
+            if isinstance(result, BaseException):
+                fail_count += 1
+                self.logger.error("启动检查失败 %s: %s", item.url, result)
+                continue
+            
+            stock_available, error, check_info, checked_at = result
+            if error:
+                fail_count += 1
+                self.logger.debug("智能检查: %s (用户: %s) ❌ 检查失败: %s", item.name, item.user_id, error)
+            else:
+                confidence = check_info.get('confidence', 0)
+                if confidence < self.config_manager.config.confidence_threshold:
+                    low_confidence_count += 1
+                    self.logger.debug("智能检查: %s (用户: %s) ⚠️ 置信度过低: %.2f",
+                                      item.name, item.user_id, confidence)
                 else:
-                    confidence = check_info.get('confidence', 0)
-                    if confidence < self.config_manager.config.confidence_threshold:
-                        low_confidence_count += 1
-                        print(f"  ⚠️ 置信度过低: {confidence:.2f}")
-                    else:
-                        success_count += 1
-                        status = "🟢 有货" if stock_available else "🔴 无货"
-                        print(f"  ✅ 状态：{status} (置信度: {confidence:.2f})")
-                    
-                    # 更新项目状态
-                    await self._update_item_status(item.id, stock_available)
+                    success_count += 1
+                    self.logger.debug("智能检查: %s (用户: %s) ✅ 状态：%s (置信度: %.2f)",
+                                      item.name, item.user_id,
+                                      "🟢 有货" if stock_available else "🔴 无货", confidence)
                 
-            except Exception as e:
-                fail_count += 1
-                self.logger.error(f"启动检查失败 {item.url}: {e}")
-                print(f"  ❌ 检查异常: {e}")
+                status_rows.append((item.id, stock_available, checked_at))
+        
+        # 更新项目状态
+        await self._update_item_statuses(status_rows)
         
         summary = (
             f"🧠 智能启动检查完成\n\n"
@@ -212,38 +221,108 @@ class VPSMonitor:
         )
         
         # 只通知管理员
-        config = self.config_manager.config
-        if config.admin_ids:
-            for admin_id in config.admin_ids:
-                await self.telegram_bot.send_notification(summary, chat_id=admin_id)
+        await self._notify_admins(summary)
         
         print(f"\n{summary}")
     
-    async def _update_item_status(self, item_id: str, status: bool) -> None:
-        """更新监控项状态"""
+    async def _check_items(self, items: Dict) -> List:
+        """并发检查监控项，结果顺序与 items 一致；单项异常作为结果返回，不影响其他项
+        
+        多个监控项可能是同一个URL（不同用户添加的同一商品），同一URL本轮只请求一次。
+        """
+        url_checks: Dict[str, asyncio.Future] = {}
+        for item in items.values():
+            if item.url not in url_checks:
+                url_checks[item.url] = asyncio.ensure_future(self._check_url(item.url))
+        
+        return await asyncio.gather(
+            *(self._check_item(item, url_checks[item.url]) for item in items.values()),
+            return_exceptions=True
+        )
+    
+    async def _check_url(self, url: str) -> Tuple[Optional[bool], Optional[str], Dict]:
+        """在并发上限内检查一个URL的库存"""
+        async with self._check_semaphore:
+            return await self.stock_checker.check_stock(url)
+    
+    async def _check_item(self, item, url_check: asyncio.Future) -> Tuple[Optional[bool], Optional[str], Dict, str]:
+        """等待该监控项URL的检查结果并记录检查历史，返回 (库存状态, 错误, 检查信息, 检查时间)"""
+        stock_available, error, check_info = await url_check
+        checked_at = datetime.now().isoformat()
+        
+        # 记录检查历史
+        await self.db_manager.add_check_history(
+            monitor_id=item.id,
+            status=stock_available,
+            response_time=check_info['response_time'],
+            error_message=error or '',
+            http_status=check_info['http_status'],
+            content_length=check_info['content_length'],
+            confidence=check_info.get('confidence', 0),
+            method_used=check_info.get('method', 'SMART_COMBO'),
+            check_time=checked_at
+        )
+        return stock_available, error, check_info, checked_at
+    
+    async def _update_item_statuses(self, status_rows: List[Tuple[str, bool, str]]) -> None:
+        """提交本轮检查的监控项状态，由数据库后台写入任务连同检查历史一起写入"""
         try:
-            async with aiosqlite.connect(self.db_manager.db_path) as db:
-                await db.execute(
-                    "UPDATE monitor_items SET status = ?, last_checked = ? WHERE id = ?",
-                    (1 if status else 0, datetime.now().isoformat(), item_id)
-                )
-                await db.commit()
+            await self.db_manager.queue_item_check_statuses(status_rows)
         except Exception as e:
-            self.logger.error(f"更新项目状态失败: {e}")
+            self.logger.error("更新项目状态失败: %s", e)
+    
+    async def _run_loops(self) -> None:
+        """同时运行检查循环和通知聚合任务
+        
+        任一方异常退出时取消另一方并抛出异常，避免通知任务静默停止而检查仍在继续。
+        （README 支持 Python 3.7+，因此没有使用 3.11 的 TaskGroup。）
+        """
+        monitor_task = asyncio.create_task(self._monitor_loop())
+        tasks = {monitor_task}
+        if self._aggregator_task:
+            tasks.add(self._aggregator_task)
+        
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            monitor_task.cancel()
+            raise
+        
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._aggregator_task = None
+        
+        # stop() 取消的任务属于正常退出，其余异常向上抛出
+        for task in done:
+            if not task.cancelled():
+                task.result()
     
     async def _monitor_loop(self) -> None:
         """监控循环"""
-        while self._running:
+        while not self._stop_event.is_set():
             try:
+                cycle_start = time.monotonic()
                 await self._check_all_items()
-                await self._process_notifications()
                 
-                # 等待下次检查
-                await asyncio.sleep(self.config_manager.config.check_interval)
+                # 等待下次检查：按本轮开始时间计算，检查耗时不会拉长检查周期
+                next_check = cycle_start + self.config_manager.config.check_interval
+                await self._wait_for_stop(max(0.0, next_check - time.monotonic()))
                 
             except Exception as e:
-                self.logger.error(f"监控循环错误: {e}")
-                await asyncio.sleep(60)  # 出错时等待1分钟
+                self.logger.error("监控循环错误: %s", e)
+                await self._wait_for_stop(60)  # 出错时等待1分钟
+    
+    async def _wait_for_stop(self, timeout: float) -> None:
+        """等待指定秒数，收到停止请求时提前返回"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    def request_stop(self) -> None:
+        """请求停止监控（可在信号处理器中调用），监控循环会在当前检查结束后退出"""
+        self._stop_event.set()
     
     async def _check_all_items(self) -> None:
         """检查所有监控项"""
@@ -252,66 +331,73 @@ class VPSMonitor:
         if not items:
             return
         
-        print(f"🔍 检查 {len(items)} 个监控项...")
+        self.logger.info("🔍 检查 %d 个监控项...", len(items))
         
-        for item in items.values():
-            try:
-                stock_available, error, check_info = await self.stock_checker.check_stock(item.url)
-                
-                # 记录检查历史
-                await self.db_manager.add_check_history(
-                    monitor_id=item.id,
-                    status=stock_available,
-                    response_time=check_info['response_time'],
-                    error_message=error or '',
-                    http_status=check_info['http_status'],
-                    content_length=check_info['content_length'],
-                    confidence=check_info.get('confidence', 0),
-                    method_used=check_info.get('method', 'SMART_COMBO')
-                )
-                
-                # 检查是否需要通知
-                if not error and stock_available is not None:
-                    await self._check_for_notifications(item, stock_available, check_info)
-                    await self._update_item_status(item.id, stock_available)
-                
-            except Exception as e:
-                self.logger.error(f"检查项目失败 {item.url}: {e}")
+        # 本轮状态变为有货、等待通知权限判断的监控项
+        candidates = []
+        
+        results = await self._check_items(items)
+        status_rows = []
+        
+        for item, result in zip(items.values(), results):
+            if isinstance(result, BaseException):
+                self.logger.error("检查项目失败 %s: %s", item.url, result)
+                continue
+            
+            stock_available, error, check_info, checked_at = result
+            
+            # 检查是否需要通知（判断依据的是本轮更新前的状态）
+            if not error and stock_available is not None:
+                if self._is_notification_candidate(item, stock_available, check_info):
+                    candidates.append((item, check_info.get('confidence', 0)))
+                status_rows.append((item.id, stock_available, checked_at))
+        
+        await self._update_item_statuses(status_rows)
+        
+        if candidates:
+            await self._queue_notifications(candidates, SweepContext.create())
     
-    async def _check_for_notifications(self, item, stock_available: bool, check_info: Dict) -> None:
-        """检查是否需要发送通知 - 修改为通知用户本人"""
+    def _is_notification_candidate(self, item, stock_available: bool, check_info: Dict) -> bool:
+        """状态变为有货且置信度达标时才需要通知"""
         # 只有状态变化或首次检查时才通知
-        if item.status != stock_available:
-            confidence = check_info.get('confidence', 0)
+        if item.status == stock_available:
+            return False
+        
+        confidence = check_info.get('confidence', 0)
+        return stock_available and confidence >= self.config_manager.config.confidence_threshold
+    
+    async def _queue_notifications(self, candidates: List, ctx: SweepContext) -> None:
+        """批量检查通知权限并加入待发送队列 - 通知用户本人"""
+        notifiable = set(await self.db_manager.filter_notifiable([item.id for item, _ in candidates], ctx))
+        now = time.monotonic()
+        cooldown = self.config_manager.config.notification_cooldown
+        
+        for item, confidence in candidates:
+            if item.id not in notifiable:
+                continue
             
-            if stock_available and confidence >= self.config_manager.config.confidence_threshold:
-                # 检查用户是否可以收到通知
-                can_notify = await self.db_manager.check_can_notify_user(item.user_id, item.id)
-                
-                if can_notify:
-                    # 有货通知
-                    notification = {
-                        'type': 'stock_available',
-                        'item': item,
-                        'confidence': confidence,
-                        'timestamp': datetime.now()
-                    }
-                    
-                    # 检查通知冷却
-                    cooldown_key = f"{item.id}_available"
-                    last_notified = self._last_notified.get(cooldown_key)
-                    
-                    if not last_notified or (datetime.now() - last_notified).seconds > self.config_manager.config.notification_cooldown:
-                        self._pending_notifications.append(notification)
-                        self._last_notified[cooldown_key] = datetime.now()
+            # 有货通知
+            notification = {
+                'type': 'stock_available',
+                'item': item,
+                'confidence': confidence,
+                'timestamp': ctx.now
+            }
+            
+            # 检查通知冷却
+            cooldown_key = f"{item.id}_available"
+            last_notified = self._last_notified.get(cooldown_key)
+            
+            if last_notified is None or now - last_notified > cooldown:
+                self._notification_queue.put_nowait(notification)
+                self._last_notified[cooldown_key] = now
     
-    async def _send_user_notifications(self, user_id: str, notifications: List[Dict]) -> None:
-        """发送用户通知"""
+    async def _send_user_notifications(self, user_id: str, notifications: List[Dict],
+                                       ctx: SweepContext, user_info: Optional[User]) -> None:
+        """发送用户通知（user_info 由调用方批量预取）"""
         try:
-            # 获取用户信息
-            user_info = await self.db_manager.get_user(user_id)
             if not user_info:
-                self.logger.warning(f"用户 {user_id} 不存在")
+                self.logger.warning("用户 %s 不存在", user_id)
                 return
             
             user_display = user_info.username or user_info.first_name or f"用户{user_id}"
@@ -327,57 +413,57 @@ class VPSMonitor:
                     f"📝 **商品:** {item.name}\n"
                     f"🔗 **链接:** {item.url}\n"
                     f"🎯 **置信度:** {confidence:.2f}\n"
-                    f"🕐 **检测时间:** {datetime.now().strftime('%H:%M:%S')}\n\n"
+                    f"🕐 **检测时间:** {ctx.now.strftime('%H:%M:%S')}\n\n"
                     f"🧠 **检测方法:** 智能组合算法\n"
                     f"💡 **提示:** 库存变化较快，请及时查看"
                 )
             else:
                 # 批量通知
-                message = f"🟢 **批量有货提醒**\n\n"
-                message += f"👋 Hi {user_display}！您有 {len(notifications)} 个商品有货了：\n\n"
-                
-                for i, notification in enumerate(notifications[:5], 1):
-                    item = notification['item']
-                    confidence = notification['confidence']
-                    
-                    message += f"{i}. **{item.name}**\n"
-                    message += f"   🎯 置信度: {confidence:.2f}\n"
-                    message += f"   🔗 {item.url}\n\n"
+                parts = [
+                    "🟢 **批量有货提醒**\n\n",
+                    f"👋 Hi {user_display}！您有 {len(notifications)} 个商品有货了：\n\n"
+                ]
+                parts.extend(
+                    f"{i}. **{n['item'].name}**\n"
+                    f"   🎯 置信度: {n['confidence']:.2f}\n"
+                    f"   🔗 {n['item'].url}\n\n"
+                    for i, n in enumerate(notifications[:5], 1)
+                )
                 
                 if len(notifications) > 5:
-                    message += f"...还有 {len(notifications) - 5} 个商品有货\n\n"
+                    parts.append(f"...还有 {len(notifications) - 5} 个商品有货\n\n")
                 
-                message += f"🕐 **检测时间:** {datetime.now().strftime('%H:%M:%S')}\n"
-                message += f"💡 **提示:** 库存变化较快，请及时查看"
+                parts.append(f"🕐 **检测时间:** {ctx.now.strftime('%H:%M:%S')}\n")
+                parts.append("💡 **提示:** 库存变化较快，请及时查看")
+                message = "".join(parts)
             
             # 发送给用户本人
             try:
                 await self.telegram_bot.send_notification(message, parse_mode='Markdown', chat_id=user_id)
                 
                 # 更新用户通知记录
-                await self.db_manager.update_notification_record(user_id)
+                await self.db_manager.update_notification_record(user_id, ctx)
                 
                 # 记录通知历史
+                await self.db_manager.add_notification_history_bulk([
+                    (user_id, n['item'].id, message, 'stock_alert') for n in notifications
+                ])
+                
                 for notification in notifications:
                     item = notification['item']
-                    await self.db_manager.add_notification_history(
-                        user_id=user_id,
-                        monitor_id=item.id,
-                        message=message,
-                        notification_type='stock_alert'
-                    )
                     
                     # 添加商品通知历史
                     await self.db_manager.add_item_notification_history(
                         user_id=user_id,
                         item_id=item.id,
-                        status=True
+                        status=True,
+                        ctx=ctx
                     )
                 
-                self.logger.info(f"已向用户 {user_display} ({user_id}) 发送 {len(notifications)} 个通知")
+                self.logger.info("已向用户 %s (%s) 发送 %d 个通知", user_display, user_id, len(notifications))
                 
             except Exception as e:
-                self.logger.error(f"发送通知给用户 {user_id} 失败: {e}")
+                self.logger.error("发送通知给用户 %s 失败: %s", user_id, e)
                 
                 # 如果用户通知失败，发送给管理员
                 admin_message = (
@@ -388,46 +474,74 @@ class VPSMonitor:
                     f"请检查用户是否已启动机器人对话"
                 )
                 
-                for admin_id in self.config_manager.config.admin_ids:
-                    await self.telegram_bot.send_notification(admin_message, parse_mode='Markdown', chat_id=admin_id)
+                await self._notify_admins(admin_message, parse_mode='Markdown')
                 
         except Exception as e:
-            self.logger.error(f"处理用户通知失败: {e}")
+            self.logger.error("处理用户通知失败: %s", e)
     
-    async def _process_notifications(self) -> None:
-        """处理待发送的通知"""
-        if not self._pending_notifications:
-            return
-        
-        # 检查是否到达聚合时间
-        time_since_last = (datetime.now() - self._last_aggregation_time).seconds
-        if time_since_last < self.config_manager.config.notification_aggregation_interval:
-            return
+    async def _aggregator_loop(self) -> None:
+        """从队列收集通知，距上次发送满聚合间隔后立即批量发送"""
+        while True:
+            batch = [await self._notification_queue.get()]
+            
+            deadline = self._last_aggregation_time + self.config_manager.config.notification_aggregation_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._notification_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            while not self._notification_queue.empty():
+                batch.append(self._notification_queue.get_nowait())
+            
+            try:
+                await self._process_notifications(batch)
+            except Exception as e:
+                self.logger.error("发送聚合通知失败: %s", e)
+            finally:
+                self._last_aggregation_time = time.monotonic()
+    
+    async def _process_notifications(self, pending: List[Dict]) -> None:
+        """按用户分组发送一批通知"""
+        ctx = SweepContext.create()
         
         # 按用户分组通知
         user_notifications = {}
-        for notification in self._pending_notifications:
+        for notification in pending:
             user_id = notification['item'].user_id
             if user_id not in user_notifications:
                 user_notifications[user_id] = []
             user_notifications[user_id].append(notification)
         
-        # 为每个用户发送通知
-        for user_id, notifications in user_notifications.items():
-            await self._send_user_notifications(user_id, notifications)
+        # 一次查询取出所有相关用户，再并发为每个用户发送通知
+        users = await self.db_manager.get_users_bulk(user_notifications.keys())
+        semaphore = asyncio.Semaphore(self.NOTIFY_CONCURRENCY)
         
-        # 清空待发送列表
-        self._pending_notifications.clear()
-        self._last_aggregation_time = datetime.now()
+        async def send(user_id: str, notifications: List[Dict]) -> None:
+            async with semaphore:
+                await self._send_user_notifications(user_id, notifications, ctx, users.get(user_id))
+        
+        await asyncio.gather(
+            *(send(user_id, notifications) for user_id, notifications in user_notifications.items()),
+            return_exceptions=True
+        )
     
-    async def _send_aggregated_notifications(self, notifications: List[Dict]) -> None:
+    async def _send_aggregated_notifications(self, notifications: List[Dict],
+                                             ctx: Optional[SweepContext] = None) -> None:
         """发送聚合通知"""
+        ctx = ctx or SweepContext.create()
+        check_time = ctx.now.strftime('%H:%M:%S')
+        users = await self.db_manager.get_users_bulk(n['item'].user_id for n in notifications)
+        
         if len(notifications) == 1:
             # 单个通知
             item = notifications[0]['item']
             confidence = notifications[0]['confidence']
             
-            user_info = await self.db_manager.get_user(item.user_id)
+            user_info = users.get(item.user_id)
             user_display = "未知用户"
             if user_info:
                 user_display = user_info.username or user_info.first_name or f"用户{item.user_id}"
@@ -438,49 +552,66 @@ class VPSMonitor:
                 f"👤 **添加者:** {user_display}\n"
                 f"🔗 **链接:** {item.url}\n"
                 f"🎯 **置信度:** {confidence:.2f}\n"
-                f"🕐 **检测时间:** {datetime.now().strftime('%H:%M:%S')}\n\n"
+                f"🕐 **检测时间:** {check_time}\n\n"
                 f"🧠 **检测方法:** 智能组合算法"
             )
         else:
             # 批量通知
-            message = f"🟢 **批量有货提醒** ({len(notifications)}个商品)\n\n"
+            parts = [f"🟢 **批量有货提醒** ({len(notifications)}个商品)\n\n"]
             
             for i, notification in enumerate(notifications[:5], 1):
                 item = notification['item']
                 confidence = notification['confidence']
-                user_info = await self.db_manager.get_user(item.user_id)
+                user_info = users.get(item.user_id)
                 user_display = user_info.username if user_info and user_info.username else f"用户{item.user_id}"
                 
-                message += f"{i}. **{item.name}**\n"
-                message += f"   👤 {user_display} | 🎯 {confidence:.2f}\n"
-                message += f"   🔗 {item.url}\n\n"
+                parts.append(
+                    f"{i}. **{item.name}**\n"
+                    f"   👤 {user_display} | 🎯 {confidence:.2f}\n"
+                    f"   🔗 {item.url}\n\n"
+                )
             
             if len(notifications) > 5:
-                message += f"...还有 {len(notifications) - 5} 个商品有货\n\n"
+                parts.append(f"...还有 {len(notifications) - 5} 个商品有货\n\n")
             
-            message += f"🕐 **检测时间:** {datetime.now().strftime('%H:%M:%S')}"
+            parts.append(f"🕐 **检测时间:** {check_time}")
+            message = "".join(parts)
         
         # 发送给所有管理员
-        for admin_id in self.config_manager.config.admin_ids:
-            await self.telegram_bot.send_notification(message, parse_mode='Markdown', chat_id=admin_id)
+        await self._notify_admins(message, parse_mode='Markdown')
         
         # 记录通知历史
-        for notification in notifications:
-            item = notification['item']
-            await self.db_manager.add_notification_history(
-                user_id=item.user_id,
-                monitor_id=item.id,
-                message=message,
-                notification_type='stock_alert'
-            )
+        await self.db_manager.add_notification_history_bulk([
+            (n['item'].user_id, n['item'].id, message, 'stock_alert') for n in notifications
+        ])
+    
+    async def _notify_admins(self, message: str, parse_mode: str = None) -> None:
+        """并发发送消息给所有管理员，单个管理员发送失败不影响其他管理员"""
+        admin_ids = self.config_manager.config.admin_ids
+        results = await asyncio.gather(
+            *(self.telegram_bot.send_notification(message, parse_mode=parse_mode, chat_id=admin_id)
+              for admin_id in admin_ids),
+            return_exceptions=True
+        )
+        for admin_id, result in zip(admin_ids, results):
+            if isinstance(result, Exception):
+                self.logger.error("发送通知给管理员 %s 失败: %s", admin_id, result)
     
     async def stop(self) -> None:
         """停止监控"""
         print("🛑 正在停止监控系统...")
-        self._running = False
+        self._stop_event.set()
+        if self._aggregator_task:
+            self._aggregator_task.cancel()
+            try:
+                await self._aggregator_task
+            except asyncio.CancelledError:
+                pass
+            self._aggregator_task = None
         if self.stock_checker:
-            self.stock_checker.close()
+            await self.stock_checker.aclose()
         if self.telegram_bot:
             await self.telegram_bot.shutdown()
+        await self.db_manager.close()
         self.logger.info("监控程序已停止")
         print("✅ 监控程序已停止")
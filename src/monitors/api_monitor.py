@@ -10,6 +10,7 @@ import json
 import asyncio
 import logging
 import cloudscraper
+from functools import partial
 from typing import List, Tuple, Optional, Dict, Any
 from urllib.parse import urljoin, urlparse
 from config import Config
@@ -44,10 +45,8 @@ class APIMonitor:
                 self.logger.debug(f"使用缓存的API端点: {domain}")
                 return self.api_cache[domain]
             
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.session.get(url, timeout=self.config.request_timeout)
+            response = await asyncio.get_running_loop().run_in_executor(
+                None, partial(self.session.get, url, timeout=self.config.request_timeout)
             )
             
             if response.status_code != 200:
@@ -271,7 +270,7 @@ class APIMonitor:
     async def check_api_stock(self, api_url: str) -> Tuple[Optional[bool], str]:
         """检查API接口的库存信息（增强版）"""
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             # 尝试不同的HTTP方法
             methods = ['GET', 'POST']
@@ -281,17 +280,13 @@ class APIMonitor:
                     if method == 'GET':
                         response = await loop.run_in_executor(
                             None,
-                            lambda: self.session.get(api_url, timeout=self.config.request_timeout)
+                            partial(self.session.get, api_url, timeout=self.config.request_timeout)
                         )
                     else:
                         # POST请求可能需要一些参数
                         response = await loop.run_in_executor(
                             None,
-                            lambda: self.session.post(
-                                api_url, 
-                                json={}, 
-                                timeout=self.config.request_timeout
-                            )
+                            partial(self.session.post, api_url, json={}, timeout=self.config.request_timeout)
                         )
                     
                     if response.status_code in [200, 201]:
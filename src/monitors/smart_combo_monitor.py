@@ -5,21 +5,120 @@ VPS监控系统 v3.1
 增强了判断逻辑和准确性
 """
 
+import re
 import time
+import hashlib
+import random
 import asyncio
 import logging
 import cloudscraper
 from datetime import datetime
+from functools import partial
+from urllib.parse import urlsplit
 from typing import Dict, Any, Tuple, Optional, List
 from config import Config
 from .fingerprint_monitor import PageFingerprintMonitor
 from .dom_monitor import DOMElementMonitor
 from .api_monitor import APIMonitor
 
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+_CHARSET_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
 
 class SmartComboMonitor:
     """智能组合监控器（优化版）"""
     
+    # 目标站点限流(429/503)时的最大重试次数
+    RATE_LIMIT_STATUSES = (429, 503)
+    RATE_LIMIT_RETRIES = 3
+    # 等待期间仍占用并发名额，Retry-After 超过该秒数时不再等待，直接返回限流结果
+    MAX_RETRY_AFTER = 30
+    
+    # Cloudflare 质询页特征，命中时改用 cloudscraper 重新抓取
+    CF_CHALLENGE_STATUSES = (403, 503)
+    CF_CHALLENGE_MARKERS = ('cf-browser-verification', 'cf_chl_', 'Just a moment...')
+    
+    # 分层的关键词系统
+    KEYWORD_LAYERS = {
+        'critical_out_of_stock': {
+            'keywords': [
+                ('out of stock', 1.0),
+                ('sold out', 1.0),
+                ('缺货', 1.0),
+                ('售罄', 1.0),
+                ('currently unavailable', 0.95),
+                ('temporarily unavailable', 0.95),
+                ('no longer available', 1.0),
+                ('discontinued', 1.0),
+                ('暂时缺货', 0.95),
+                ('暂无库存', 0.95),
+                ('库存不足', 0.9),
+                ('无货', 1.0),
+                ('断货', 1.0),
+            ],
+            'context_boost': ['title', 'h1', 'h2', 'alert', 'warning', 'error'],
+            'context_penalty': ['maybe', 'previous', 'was', 'history']
+        },
+        'moderate_out_of_stock': {
+            'keywords': [
+                ('not available', 0.8),
+                ('unavailable', 0.7),
+                ('coming soon', 0.7),
+                ('pre-order', 0.6),
+                ('notify me', 0.7),
+                ('waitlist', 0.7),
+                ('join waiting list', 0.8),
+                ('back in stock', 0.7),
+                ('restock', 0.6),
+                ('补货中', 0.7),
+                ('即将上架', 0.7),
+                ('敬请期待', 0.7),
+                ('到货通知', 0.7),
+            ],
+            'context_boost': ['product', 'item', 'plan'],
+            'context_penalty': ['newsletter', 'blog', 'article']
+        },
+        'in_stock': {
+            'keywords': [
+                ('add to cart', 0.9),
+                ('buy now', 0.95),
+                ('purchase now', 0.95),
+                ('order now', 0.9),
+                ('in stock', 0.95),
+                ('available now', 0.95),
+                ('立即购买', 0.95),
+                ('加入购物车', 0.9),
+                ('现在订购', 0.9),
+                ('有货', 0.95),
+                ('现货', 0.95),
+                ('立即订购', 0.9),
+                ('马上购买', 0.95),
+            ],
+            'context_boost': ['price', 'cost', '$', '¥', '€', 'plan', 'package'],
+            'context_penalty': ['demo', 'trial', 'example', 'documentation']
+        },
+        'ambiguous': {
+            'keywords': [
+                ('available', 0.5),
+                ('order', 0.4),
+                ('get started', 0.4),
+                ('configure', 0.4),
+                ('continue', 0.3),
+                ('create', 0.2),
+                ('选择', 0.3),
+                ('开始', 0.3),
+            ],
+            'context_boost': ['checkout', 'payment', 'billing'],
+            'context_penalty': ['login', 'register', 'account', 'support']
+        }
+    }
+    
+    
     def __init__(self, config: Config):
         self.config = config
         self.fingerprint_monitor = PageFingerprintMonitor()
@@ -31,6 +130,13 @@ class SmartComboMonitor:
         self.recent_checks = {}  # URL -> (timestamp, result)
         self.cache_duration = 60  # 60秒缓存
         
+        # 页面分析缓存：URL -> 内容哈希、ETag/Last-Modified 及关键词/结构分析结果
+        # 页面未变化（304 或内容哈希相同）时直接复用，跳过解析
+        self._page_cache: Dict[str, Dict[str, Any]] = {}
+        
+        # 按主机限制并发，避免同一商家的多个商品同时请求触发限流
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        
         self.scraper = cloudscraper.create_scraper(
             browser={
                 'browser': 'chrome',
@@ -40,6 +146,96 @@ class SmartComboMonitor:
             },
             debug=config.debug
         )
+        # 共享的异步HTTP会话，在事件循环中按需创建
+        self._session = None
+    
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """获取目标主机对应的并发信号量（按需创建）"""
+        host = urlsplit(url).netloc.lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, self.config.per_host_concurrency))
+            self._host_semaphores[host] = semaphore
+        return semaphore
+    
+    def _get_session(self):
+        """获取共享的aiohttp会话（按需创建）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60),
+                headers={'User-Agent': self.config.user_agent},
+                timeout=aiohttp.ClientTimeout(total=self.config.request_timeout)
+            )
+        return self._session
+    
+    def _is_cf_challenge(self, status: int, text: str) -> bool:
+        """判断响应是否为Cloudflare质询页"""
+        if status not in self.CF_CHALLENGE_STATUSES:
+            return False
+        return any(marker in text for marker in self.CF_CHALLENGE_MARKERS)
+    
+    @staticmethod
+    def _decode_body(raw: bytes, charset: Optional[str]) -> str:
+        """按响应头声明的编码解码页面，未声明或无效时按UTF-8解码（不做编码探测）"""
+        if charset:
+            try:
+                return raw.decode(charset, errors='replace')
+            except LookupError:
+                pass
+        return raw.decode('utf-8', errors='replace')
+    
+    async def _scraper_get(self, url: str, request_headers: Optional[Dict[str, str]] = None
+                           ) -> Tuple[int, str, Dict[str, str]]:
+        """使用cloudscraper抓取页面（在线程池中执行）"""
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.scraper.get, url, headers=request_headers,
+                          timeout=self.config.request_timeout)
+        )
+        match = _CHARSET_RE.search(response.headers.get('Content-Type', ''))
+        charset = match.group(1) if match else None
+        headers = {key.lower(): value for key, value in response.headers.items()}
+        return response.status_code, self._decode_body(response.content, charset), headers
+    
+    async def _get_page(self, url: str, request_headers: Optional[Dict[str, str]] = None
+                        ) -> Tuple[int, str, Dict[str, str]]:
+        """抓取页面：优先走aiohttp，遇到Cloudflare质询再回退到cloudscraper"""
+        if not AIOHTTP_AVAILABLE:
+            return await self._scraper_get(url, request_headers)
+        
+        async with self._get_session().get(url, headers=request_headers) as resp:
+            text = self._decode_body(await resp.read(), resp.charset)
+            status = resp.status
+            headers = {key.lower(): value for key, value in resp.headers.items()}
+        
+        if self._is_cf_challenge(status, text):
+            self.logger.debug(f"检测到Cloudflare质询，改用cloudscraper: {url}")
+            return await self._scraper_get(url, request_headers)
+        return status, text, headers
+    
+    async def fetch_page(self, url: str, request_headers: Optional[Dict[str, str]] = None
+                         ) -> Tuple[int, str, Dict[str, str]]:
+        """抓取页面，遇到429/503时按指数退避重试；返回的响应头名称统一为小写"""
+        attempt = 0
+        while True:
+            status, text, headers = await self._get_page(url, request_headers)
+            if status not in self.RATE_LIMIT_STATUSES or attempt >= self.RATE_LIMIT_RETRIES:
+                return status, text, headers
+            
+            retry_after = headers.get('retry-after', '')
+            if retry_after.isdigit():
+                delay = float(retry_after)
+                if delay > self.MAX_RETRY_AFTER:
+                    self.logger.info(
+                        "目标站点限流(HTTP %d)，Retry-After %s秒过长，放弃重试: %s", status, retry_after, url
+                    )
+                    return status, text, headers
+            else:
+                delay = 2 ** attempt + random.uniform(0, 1)
+            self.logger.info(
+                "目标站点限流(HTTP %d)，%.1f秒后重试: %s", status, delay, url
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
     
     async def check_stock(self, url: str) -> Tuple[Optional[bool], Optional[str], Dict[str, Any]]:
         """智能组合检查库存状态"""
@@ -53,8 +249,9 @@ class SmartComboMonitor:
                 return cached_result
         
         try:
-            # 执行综合检查
-            result = await self.comprehensive_check(url)
+            # 执行综合检查（同一主机的并发受限）
+            async with self._host_semaphore(url):
+                result = await self.comprehensive_check(url)
             
             check_info = {
                 'response_time': time.time() - start_time,
@@ -108,14 +305,32 @@ class SmartComboMonitor:
         # 方法1: 获取页面内容
         async def check_page_content():
             try:
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self.scraper.get(url, timeout=self.config.request_timeout)
-                )
+                cached = self._page_cache.get(url)
+                request_headers = None
+                if cached:
+                    # 条件请求：页面未变化时服务器返回304，无需重新下载和解析
+                    request_headers = {}
+                    if cached['etag']:
+                        request_headers['If-None-Match'] = cached['etag']
+                    if cached['last_modified']:
+                        request_headers['If-Modified-Since'] = cached['last_modified']
+                
+                status_code, html_content, headers = await self.fetch_page(url, request_headers or None)
                 
-                if response and response.status_code == 200:
-                    html_content = response.text
+                content_hash = None
+                if status_code == 200:
+                    content_hash = hashlib.blake2b(html_content.encode('utf-8'), digest_size=16).hexdigest()
+                
+                if cached and (status_code == 304 or content_hash == cached['hash']):
+                    # 页面未变化，复用上次的分析结果
+                    results['methods']['fingerprint'] = {
+                        'changed': False,
+                        'message': "页面内容无变化"
+                    }
+                    results['methods']['keywords'] = cached['keywords']
+                    results['methods']['structure'] = cached['structure']
+                    
+                elif status_code == 200:
                     
                     # 页面指纹检查
                     fingerprint_changed, fp_message = await self.fingerprint_monitor.check_page_changes(url, html_content)
@@ -132,6 +347,18 @@ class SmartComboMonitor:
                     structure_result = self._analyze_page_structure(html_content)
                     results['methods']['structure'] = structure_result
                     
+                    cached = self._page_cache[url] = {
+                        'hash': content_hash,
+                        'etag': None,
+                        'last_modified': None,
+                        'keywords': keyword_result,
+                        'structure': structure_result
+                    }
+                
+                if cached and status_code == 200:
+                    cached['etag'] = headers.get('etag')
+                    cached['last_modified'] = headers.get('last-modified')
+                    
             except Exception as e:
                 results['methods']['basic'] = {'error': str(e)}
         
@@ -176,95 +403,22 @@ class SmartComboMonitor:
         """高级关键词检查（优化版）"""
         content_lower = content.lower()
         
-        # 分层的关键词系统
-        keyword_layers = {
-            'critical_out_of_stock': {
-                'keywords': [
-                    ('out of stock', 1.0),
-                    ('sold out', 1.0),
-                    ('缺货', 1.0),
-                    ('售罄', 1.0),
-                    ('currently unavailable', 0.95),
-                    ('temporarily unavailable', 0.95),
-                    ('no longer available', 1.0),
-                    ('discontinued', 1.0),
-                    ('暂时缺货', 0.95),
-                    ('暂无库存', 0.95),
-                    ('库存不足', 0.9),
-                    ('无货', 1.0),
-                    ('断货', 1.0),
-                ],
-                'context_boost': ['title', 'h1', 'h2', 'alert', 'warning', 'error'],
-                'context_penalty': ['maybe', 'previous', 'was', 'history']
-            },
-            'moderate_out_of_stock': {
-                'keywords': [
-                    ('not available', 0.8),
-                    ('unavailable', 0.7),
-                    ('coming soon', 0.7),
-                    ('pre-order', 0.6),
-                    ('notify me', 0.7),
-                    ('waitlist', 0.7),
-                    ('join waiting list', 0.8),
-                    ('back in stock', 0.7),
-                    ('restock', 0.6),
-                    ('补货中', 0.7),
-                    ('即将上架', 0.7),
-                    ('敬请期待', 0.7),
-                    ('到货通知', 0.7),
-                ],
-                'context_boost': ['product', 'item', 'plan'],
-                'context_penalty': ['newsletter', 'blog', 'article']
-            },
-            'in_stock': {
-                'keywords': [
-                    ('add to cart', 0.9),
-                    ('buy now', 0.95),
-                    ('purchase now', 0.95),
-                    ('order now', 0.9),
-                    ('in stock', 0.95),
-                    ('available now', 0.95),
-                    ('立即购买', 0.95),
-                    ('加入购物车', 0.9),
-                    ('现在订购', 0.9),
-                    ('有货', 0.95),
-                    ('现货', 0.95),
-                    ('立即订购', 0.9),
-                    ('马上购买', 0.95),
-                ],
-                'context_boost': ['price', 'cost', '$', '¥', '€', 'plan', 'package'],
-                'context_penalty': ['demo', 'trial', 'example', 'documentation']
-            },
-            'ambiguous': {
-                'keywords': [
-                    ('available', 0.5),
-                    ('order', 0.4),
-                    ('get started', 0.4),
-                    ('configure', 0.4),
-                    ('continue', 0.3),
-                    ('create', 0.2),
-                    ('选择', 0.3),
-                    ('开始', 0.3),
-                ],
-                'context_boost': ['checkout', 'payment', 'billing'],
-                'context_penalty': ['login', 'register', 'account', 'support']
-            }
-        }
-        
         # 计算各层得分
         layer_scores = {}
         found_keywords = {}
         
-        for layer_name, layer_config in keyword_layers.items():
+        for layer_name, layer_config in self.KEYWORD_LAYERS.items():
             layer_score = 0
             layer_keywords = []
             
             for keyword, base_weight in layer_config['keywords']:
-                if keyword in content_lower:
+                keyword_pos = content_lower.find(keyword)
+                if keyword_pos != -1:
                     # 计算上下文权重
                     context_weight = self._calculate_context_weight(
                         content_lower, 
                         keyword, 
+                        keyword_pos, 
                         layer_config['context_boost'], 
                         layer_config['context_penalty']
                     )
@@ -354,13 +508,9 @@ class SmartComboMonitor:
             'details': {}
         }
     
-    def _calculate_context_weight(self, content: str, keyword: str, 
+    def _calculate_context_weight(self, content: str, keyword: str, keyword_pos: int,
                                 boost_words: List[str], penalty_words: List[str]) -> float:
-        """计算关键词的上下文权重"""
-        keyword_pos = content.find(keyword)
-        if keyword_pos == -1:
-            return 1.0
-        
+        """计算关键词的上下文权重（keyword_pos 为关键词首次出现的位置）"""
         # 检查关键词前后100个字符的上下文
         context_start = max(0, keyword_pos - 100)
         context_end = min(len(content), keyword_pos + len(keyword) + 100)
@@ -567,5 +717,11 @@ class SmartComboMonitor:
             self.dom_monitor.close()
         # 清理缓存
         self.recent_checks.clear()
-
-    import re
+        self._page_cache.clear()
+    
+    async def aclose(self):
+        """关闭监控器并释放HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self.close()
@@ -22,6 +22,7 @@ from utils import is_valid_url, calculate_success_rate, escape_markdown
 from monitors import SmartComboMonitor
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -35,9 +36,15 @@ from telegram.ext import (
 class TelegramBot:
     """Telegram机器人（多用户增强版）"""
     
-    def __init__(self, config: Config, db_manager: DatabaseManager):
+    # 发送通知遇到 RetryAfter（429）时的最大重试次数
+    SEND_RETRIES = 2
+    
+    def __init__(self, config: Config, db_manager: DatabaseManager,
+                 stock_checker: Optional[SmartComboMonitor] = None):
         self.config = config
         self.db_manager = db_manager
+        # 与监控循环共用的检查器，复用其HTTP连接池
+        self.stock_checker = stock_checker
         self.app = None
         self.logger = logging.getLogger(__name__)
     
@@ -683,16 +690,13 @@ class TelegramBot:
             if not name:
                 try:
                     await adding_msg.edit_text("⏳ 正在获取页面信息...")
-                    smart_monitor = SmartComboMonitor(self.config)
-                    loop = asyncio.get_event_loop()
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: smart_monitor.scraper.get(url, timeout=10)
-                    )
+                    if self.stock_checker is None:
+                        self.stock_checker = SmartComboMonitor(self.config)
+                    status_code, page_text, _ = await self.stock_checker.fetch_page(url)
                     
-                    if response and response.status_code == 200:
+                    if status_code == 200:
                         # 尝试多种方式获取标题
-                        title_match = re.search(r'<title[^>]*>(.*?)</title>', response.text, re.IGNORECASE | re.DOTALL)
+                        title_match = re.search(r'<title[^>]*>(.*?)</title>', page_text, re.IGNORECASE | re.DOTALL)
                         if title_match:
                             raw_title = title_match.group(1).strip()
                             # 清理标题中的特殊字符和多余空格
@@ -701,11 +705,9 @@ class TelegramBot:
                         
                         # 如果标题为空或太短，尝试获取h1标签
                         if not name or len(name) < 3:
-                            h1_match = re.search(r'<h1[^>]*>(.*?)</h1>', response.text, re.IGNORECASE | re.DOTALL)
+                            h1_match = re.search(r'<h1[^>]*>(.*?)</h1>', page_text, re.IGNORECASE | re.DOTALL)
                             if h1_match:
                                 name = re.sub(r'<[^>]+>', '', h1_match.group(1)).strip()[:50]
-                    
-                    smart_monitor.close()
                 except Exception as e:
                     self.logger.warning(f"获取页面标题失败: {e}")
                 
@@ -737,15 +739,18 @@ class TelegramBot:
                     parse_mode='Markdown'
                 )
                 
-                # 通知管理员
-                for admin_id in self.config.admin_ids:
-                    await self.send_notification(
-                        message=f"📝 新增监控项\n\n"
-                                f"👤 用户: {user.username or user.first_name or user_id}\n"
-                                f"📝 名称: {name}\n"
-                                f"🔗 URL: {url}",
-                        chat_id=admin_id
-                    )
+                # 通知管理员（消息只构建一次，并发发送）
+                admin_message = (
+                    f"📝 新增监控项\n\n"
+                    f"👤 用户: {user.username or user.first_name or user_id}\n"
+                    f"📝 名称: {name}\n"
+                    f"🔗 URL: {url}"
+                )
+                await asyncio.gather(
+                    *(self.send_notification(message=admin_message, chat_id=admin_id)
+                      for admin_id in self.config.admin_ids),
+                    return_exceptions=True
+                )
             else:
                 await adding_msg.edit_text("❌ 添加失败，可能URL已存在或达到限制")
                 
@@ -757,8 +762,9 @@ class TelegramBot:
         """调试URL分析"""
         checking_msg = await message.reply_text("🔍 正在进行详细分析...")
         
+        # 调试使用独立的检查器，避免消耗监控循环的页面指纹变化
+        smart_monitor = SmartComboMonitor(self.config)
         try:
-            smart_monitor = SmartComboMonitor(self.config)
             result = await smart_monitor.comprehensive_check(url)
             
             debug_text = f"🔍 **调试分析结果**\n\n"
@@ -799,12 +805,12 @@ class TelegramBot:
             else:
                 debug_text += "💡 **建议:** 检测置信度较高，结果相对可靠\n"
             
-            smart_monitor.close()
-            
             await checking_msg.edit_text(debug_text, parse_mode='Markdown')
             
         except Exception as e:
             await checking_msg.edit_text(f"❌ 调试分析失败: {str(e)}")
+        finally:
+            await smart_monitor.aclose()
     
     # ===== 统计和状态显示 =====
     
@@ -1210,6 +1216,15 @@ class TelegramBot:
                 else:
                     await query.edit_message_text("❌ 只有管理员才能使用此功能")
             
+            elif data == 'admin_enable_vacuum':
+                if self._check_admin_permission(user_info.id):
+                    # 整库 VACUUM 可能耗时较长，先提示，完成后另发消息告知结果
+                    await query.message.reply_text("⏳ 正在转换数据库，期间数据库操作会暂停...")
+                    success, message = await self.db_manager.enable_incremental_vacuum()
+                    await query.message.reply_text(("✅ " if success else "❌ ") + message)
+                else:
+                    await query.edit_message_text("❌ 只有管理员才能使用此功能")
+            
             # 添加用户详情处理
             elif data.startswith('user_detail_'):
                 if self._check_admin_permission(user_info.id):
@@ -1819,12 +1834,14 @@ class TelegramBot:
             
             "🛠️ **其他功能:**\n"
             "• 数据库清理\n"
+            "• 启用增量VACUUM（旧数据库一次性转换，期间数据库暂停响应）\n"
             "• 日志查看\n"
             "• 性能分析\n"
         )
         
         keyboard = [
             [InlineKeyboardButton("🗑️ 清理旧数据", callback_data='admin_cleanup')],
+            [InlineKeyboardButton("🗜️ 启用增量VACUUM", callback_data='admin_enable_vacuum')],
             [InlineKeyboardButton("📋 导出日志", callback_data='admin_export_logs')],
             [InlineKeyboardButton("🔙 返回", callback_data='admin_panel')]
         ]
@@ -2304,17 +2321,25 @@ class TelegramBot:
     # ===== 核心通知方法 =====
     
     async def send_notification(self, message: str, parse_mode: str = None, chat_id: str = None) -> None:
-        """发送通知 - 修复版本"""
+        """发送通知 - 修复版本（被Telegram限流时按 retry_after 等待后重试）"""
         try:
             if self.app and self.app.bot:
                 target_chat_id = chat_id or self.config.channel_id or self.config.chat_id
                 
-                await self.app.bot.send_message(
-                    chat_id=target_chat_id, 
-                    text=message,
-                    parse_mode=parse_mode,
-                    disable_web_page_preview=False
-                )
+                for attempt in range(self.SEND_RETRIES + 1):
+                    try:
+                        await self.app.bot.send_message(
+                            chat_id=target_chat_id, 
+                            text=message,
+                            parse_mode=parse_mode,
+                            disable_web_page_preview=False
+                        )
+                        break
+                    except RetryAfter as e:
+                        if attempt >= self.SEND_RETRIES:
+                            raise
+                        self.logger.warning(f"发送通知被限流，{e.retry_after}秒后重试: {target_chat_id}")
+                        await asyncio.sleep(float(e.retry_after))
                 self.logger.info(f"通知发送成功到 {target_chat_id}")
         except Exception as e:
             self.logger.error(f"发送通知失败: {e}")
@@ -96,15 +96,15 @@ def calculate_global_success_rate(stats: dict) -> str:
     return f"{rate:.1f}%"
 
 
+# Markdown 特殊字符转义表，一次 translate 完成全部替换
+_MARKDOWN_ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in '_*[]()~`>#+-=|{}.!'})
+
+
 def escape_markdown(text: str) -> str:
     """转义Markdown特殊字符"""
     if not text:
         return text
-    
-    escape_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    return text.translate(_MARKDOWN_ESCAPE_TABLE)
 
 
 def check_dependencies():